@@ -0,0 +1,68 @@
+import asyncio
+import importlib.util
+import selectors
+import sys
+import time
+
+from typing import (
+    Callable, List, Tuple
+)
+
+from underdog.asyncthread import (
+    AsyncThread,
+    selector_loop_factory,
+    uvloop_loop_factory
+)
+
+def select_loop_factory() -> asyncio.AbstractEventLoop:
+    return asyncio.SelectorEventLoop(selectors.SelectSelector())
+
+async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    while True:
+        data = await reader.read(64)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+async def client(port: int, rounds: int):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for _ in range(rounds):
+        writer.write(b'ping')
+        await writer.drain()
+        await reader.readexactly(4)
+    writer.close()
+    await writer.wait_closed()
+
+async def exchange(sockets: int, rounds: int) -> float:
+    server = await asyncio.start_server(echo, '127.0.0.1', 0, backlog = sockets)
+    port = server.sockets[0].getsockname()[1]
+    start = time.perf_counter()
+    await asyncio.gather(*[client(port, rounds) for _ in range(sockets)])
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    return sockets * rounds / elapsed
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    backends: List[Tuple[str, Callable[[], asyncio.AbstractEventLoop], List[int]]] = [
+        ('select', select_loop_factory, [10, 100, 400]),
+        ('default', selector_loop_factory, [10, 100, 400, 2000])
+    ]
+    if importlib.util.find_spec('uvloop') is not None:
+        backends.append(('uvloop', uvloop_loop_factory, [10, 100, 400, 2000]))
+    for name, factory, sizes in backends:
+        for sockets in sizes:
+            thread = AsyncThread(loop_factory = factory)
+            thread.start()
+            try:
+                print('{0:<8} {1:>5} sockets: {2:>10,.0f} round trips/s'.format(
+                    name, sockets, thread.run_task(exchange(sockets, rounds))
+                ))
+            finally:
+                thread.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import asyncio
+import sys
+import threading
+import time
+
+import aiohttp
+
+from aiohttp import web
+
+from underdog.asyncthread import AsyncThread
+from underdog.eventloop import (
+    client_session,
+    run_task
+)
+
+def serve(port: int, ready: threading.Event):
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(text = request.query.get('t', ''))
+    async def start():
+        app = web.Application()
+        app.router.add_get('/', handler)
+        runner = web.AppRunner(app, access_log = None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(start())
+
+async def pooled_get(url: str, symbol: str) -> str:
+    async with client_session(url).get(url, params = {'t': symbol}) as response:
+        return await response.text()
+
+async def fresh_get(url: str, symbol: str) -> str:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, params = {'t': symbol}) as response:
+            return await response.text()
+
+def fresh_call(url: str, symbol: str) -> str:
+    thread = AsyncThread()
+    thread.start()
+    try:
+        return thread.run_task(fresh_get(url, symbol))
+    finally:
+        thread.stop()
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    port = 18765
+    ready = threading.Event()
+    threading.Thread(target = serve, args = (port, ready), daemon = True).start()
+    ready.wait()
+    url = 'http://127.0.0.1:{0}/'.format(port)
+    symbols = ['S{0}'.format(i) for i in range(count)]
+
+    start = time.perf_counter()
+    for symbol in symbols:
+        assert fresh_call(url, symbol) == symbol
+    fresh = time.perf_counter() - start
+
+    run_task(pooled_get(url, 'warmup'))
+    start = time.perf_counter()
+    for symbol in symbols:
+        assert run_task(pooled_get(url, symbol)) == symbol
+    pooled = time.perf_counter() - start
+
+    print('{0} sequential requests'.format(count))
+    print('fresh loop and session per call: {0:8.3f}s {1:8.3f}ms/request'.format(
+        fresh, 1e3 * fresh / count
+    ))
+    print('shared loop and pooled session:  {0:8.3f}s {1:8.3f}ms/request'.format(
+        pooled, 1e3 * pooled / count
+    ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import datetime
+import os
+import sys
+import time
+
+from typing import (
+    Any, Callable, Dict, List
+)
+
+from lxml import html
+
+from underdog.finviz.fetch import (
+    _parse_page,
+    _to_dict
+)
+
+_fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def reference_details(page: Any) -> Dict[str, Any]:
+    data = {}
+    for row in [
+        row.xpath('td//text()')
+        for row in page.cssselect('tr[class="table-dark-row"]')
+    ]:
+        for column in range(0, 11, 2):
+            data[row[column]] = row[column + 1]
+    return _to_dict(data)
+
+def reference_news(page: Any) -> List[Dict[str, Any]]:
+    news = page.cssselect('a[class="tab-link-news"]')
+    items = []
+    for i, link in enumerate(news):
+        tr = link.getparent().getparent().getparent().getparent()
+        date_str = tr[0].text.strip()
+        if ' ' not in date_str:
+            tbody = tr.getparent()
+            previous_date_str = ''
+            j = 1
+            while ' ' not in previous_date_str:
+                try:
+                    previous_date_str = tbody[i - j][0].text.strip()
+                except IndexError:
+                    break
+                j += 1
+            date_str = ' '.join([previous_date_str.split(' ')[0], date_str])
+        items.append(dict(
+            date = str(datetime.datetime.strptime(date_str, '%b-%d-%y %I:%M%p')),
+            headline = link.xpath('text()')[0],
+            url = link.get('href')
+        ))
+    return items
+
+def reference_parse(symbol: str, text: str) -> Dict[str, Any]:
+    page = html.fromstring(text)
+    return dict(details = reference_details(page), news = reference_news(page))
+
+def pages_per_second(parser: Callable[[str, str], Dict[str, Any]], text: str, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        parser('TSLA', text)
+        count += 1
+    return count / (time.perf_counter() - start)
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.
+    for name in sorted(os.listdir(_fixtures)):
+        if not name.startswith('finviz'):
+            continue
+        with open(os.path.join(_fixtures, name), encoding = 'utf-8') as file:
+            text = file.read()
+        assert _parse_page('TSLA', text) == reference_parse('TSLA', text)
+        reference = pages_per_second(reference_parse, text, seconds)
+        current = pages_per_second(_parse_page, text, seconds)
+        print('{0}: {1} bytes'.format(name, len(text)))
+        print('  full tree parser:    {0:8.1f} pages/s'.format(reference))
+        print('  fragment parser:     {0:8.1f} pages/s ({1:.1f}x)'.format(current, current / reference))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import sys
+import time
+
+from typing import Callable
+
+import numpy as np
+
+from underdog.analysis.accessor import INTRADAY_CLOSE
+from underdog.storage import (
+    append_history,
+    drop_history,
+    read_history,
+    read_intraday,
+    tail_intraday,
+    write_history
+)
+from underdog.utility import (
+    encode_dates,
+    trading_daterange
+)
+
+_symbol = 'BENCHMARK'
+
+_path = 'cache/intraday/1/{0}'.format(_symbol)
+
+def synthetic_history(start: str, end: str, seed: int = 0) -> np.ndarray:
+    days = list(trading_daterange(start, end))
+    dates = encode_dates(np.array([
+        np.datetime64(day, 'ms').astype(np.int64) + 12 * 3600 * 1000 for day in days
+    ]))
+    rng = np.random.default_rng(seed)
+    rows = 960 * len(days)
+    prices = np.round(rng.uniform(10., 500., (rows, 4)), 2)
+    return np.column_stack([
+        np.tile(np.arange(960, dtype = np.float64), len(days)),
+        prices,
+        rng.integers(0, 100000, rows).astype(np.float64),
+        prices.mean(axis = 1),
+        np.repeat(dates, 960)
+    ])
+
+def timed(fn: Callable[[], object], repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return 1e3 * (time.perf_counter() - start) / repeat
+
+def main():
+    appends = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    array = synthetic_history('2016-01-01', '2020-12-31')
+    days = np.unique(array[:, -1])
+    split = len(array) - 960 * appends
+    try:
+        write_history(_path, array[:split])
+        segments = 0
+        for offset in range(split, len(array), 960):
+            segments = append_history(_path, array[offset:offset + 960])
+        assert np.array_equal(read_history(_path), array)
+        print('{0} rows over {1} sessions, base plus {2} appends in {3} segments'.format(
+            len(array), len(days), appends, segments
+        ))
+        print('  full read_history: {0:8.2f}ms'.format(timed(lambda: read_history(_path), repeat)))
+        for n_days in [1, 20, 252]:
+            start = str(np.datetime64(int(days[-n_days]), 's').astype('datetime64[D]'))
+            assert np.array_equal(tail_intraday(_symbol, 1, n_days), array[-960 * n_days:])
+            print('  {0:>3} days: tail {1:8.2f}ms  range {2:8.2f}ms  close only {3:8.2f}ms'.format(
+                n_days,
+                timed(lambda: tail_intraday(_symbol, 1, n_days), repeat),
+                timed(lambda: read_intraday(_symbol, 1, start), repeat),
+                timed(lambda: read_intraday(_symbol, 1, start, columns = [INTRADAY_CLOSE]), repeat)
+            ))
+    finally:
+        drop_history(_path)
+
+if __name__ == '__main__':
+    main()
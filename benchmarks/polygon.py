@@ -0,0 +1,94 @@
+import datetime
+import json
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+from typing import (
+    Any, Callable, Optional
+)
+
+import numpy as np
+import pandas as pd
+
+from underdog.polygon.fetch import parse_grouped_daily
+from underdog.utility import (
+    encode_symbol,
+    twap
+)
+
+def grouped_daily_fixture(rows: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    results = []
+    symbols = set()
+    while len(symbols) < rows:
+        symbols.add(''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(1, 5))))
+    for symbol in sorted(symbols):
+        low = round(rng.uniform(1., 500.), 2)
+        high = round(low * rng.uniform(1., 1.1), 2)
+        results.append(dict(
+            T = symbol,
+            v = float(rng.randint(0, 50000000)),
+            vw = round(rng.uniform(low, high), 4),
+            o = round(rng.uniform(low, high), 2),
+            c = round(rng.uniform(low, high), 2),
+            h = high,
+            l = low,
+            t = 1634328000000,
+            n = rng.randint(1, 100000)
+        ))
+    return json.dumps(dict(
+        status = 'OK', resultsCount = len(results), results = results
+    )).encode()
+
+def reference_parse(date: datetime.date, body: bytes) -> Optional[pd.DataFrame]:
+    result = json.loads(body)
+    rows = [{**row, 'date': time.mktime(date.timetuple())} for row in result['results']]
+    df = pd.DataFrame(rows).rename(columns = {
+        'o': 'open', 'c': 'close', 'h': 'high', 'l': 'low',
+        'vw': 'vwap', 'v': 'volume', 'T': 'symbol'
+    }).drop(['n', 't'], axis = 1)
+    df = df.astype({
+        'volume': np.float64, 'open': np.float64, 'close': np.float64,
+        'high': np.float64, 'low': np.float64, 'vwap': np.float64
+    })
+    df = df[
+        (df['volume'] >= 0) & (df['open'] > 0) & (df['close'] > 0) & \
+        (df['high'] > 0) & (df['low'] > 0) & (df['vwap'] > 0)
+    ]
+    df = df.replace([np.inf, -np.inf], np.nan).dropna()
+    df['symbol'] = df['symbol'].apply(encode_symbol)
+    return twap(df).reset_index(drop = True)
+
+def measure(parser: Callable[[datetime.date, bytes], Any], date: datetime.date, body: bytes, repeat: int):
+    parser(date, body)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parser(date, body)
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    parser(date, body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (elapsed, peak)
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    date = datetime.date(2021, 10, 15)
+    body = grouped_daily_fixture(rows)
+    assert len(parse_grouped_daily(date, body)) == len(reference_parse(date, body))
+    print('{0} rows, {1} byte response'.format(rows, len(body)))
+    for name, parser in [
+        ('dataframe path', reference_parse),
+        ('columnar path', parse_grouped_daily)
+    ]:
+        elapsed, peak = measure(parser, date, body, repeat)
+        print('  {0:<15} {1:>12,.0f} rows/s {2:>8.1f} MiB peak'.format(
+            name, rows / elapsed, peak / 2 ** 20
+        ))
+
+if __name__ == '__main__':
+    main()
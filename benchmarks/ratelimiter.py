@@ -0,0 +1,39 @@
+import multiprocessing
+import sys
+import time
+
+from underdog.ratelimiter import RateLimiter
+
+def worker(name: str, duration: float, counts: multiprocessing.Queue):
+    limiter = RateLimiter(name, 1e-9, 1024)
+    limiter.window
+    count = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        with limiter:
+            count += 1
+    counts.put(count)
+
+def run(processes: int, duration: float) -> float:
+    name = 'benchmark-{0}-{1}'.format(processes, time.time_ns())
+    counts: multiprocessing.Queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target = worker, args = (name, duration, counts))
+        for _ in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    total = sum(counts.get() for _ in workers)
+    for process in workers:
+        process.join()
+    return total / duration
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 2.
+    for processes in [1, 8, 32]:
+        print('{0:>3} processes: {1:>12,.0f} acquisitions/s'.format(
+            processes, run(processes, duration)
+        ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_lazy = 'import underdog'
+
+_eager = '''
+import underdog
+for name in underdog.__all__:
+    try:
+        getattr(underdog, name)
+    except ImportError:
+        pass
+'''
+
+def run(code: str, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check = True, env = os.environ)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def importtime(top: int) -> None:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _lazy],
+        check = True, env = os.environ, capture_output = True, text = True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = [field.strip() for field in line[len('import time:'):].split('|')]
+        rows.append((int(cumulative), name))
+    print('slowest imports behind `import underdog` (cumulative us):')
+    for cumulative, name in sorted(rows, reverse = True)[:top]:
+        print('  {0:>10} {1}'.format(cumulative, name))
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = run('pass', runs)
+    lazy = run(_lazy, runs)
+    eager = run(_eager, runs)
+    print('median of {0} cold interpreter starts'.format(runs))
+    print('  bare interpreter:                {0:8.3f}s'.format(baseline))
+    print('  import underdog:                 {0:8.3f}s'.format(lazy))
+    print('  import underdog + every export:  {0:8.3f}s'.format(eager))
+    importtime(10)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import datetime
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from underdog.utility import (
+    encode_dates,
+    timestamp_to_timeslot,
+    timestamps_to_timeslots,
+    trading_daterange
+)
+
+def synthetic_candles(start: str, end: str) -> np.ndarray:
+    epochs = []
+    for date in trading_daterange(start, end):
+        base = pd.Timestamp(
+            year = date.year, month = date.month, day = date.day,
+            hour = 4, tz = 'US/Eastern'
+        ).value // 1000000
+        epochs.append(base + 60000 * np.arange(960, dtype = np.int64))
+    return np.concatenate(epochs)
+
+def reference(timestamps: pd.Series, period: int):
+    timeslots = timestamps.apply(
+        lambda x: timestamp_to_timeslot(
+            pd.Timestamp(x, tz = 'US/Eastern', unit = 'ms'),
+            period = period
+        )
+    )
+    dates = timestamps.apply(
+        lambda x: time.mktime(datetime.datetime.fromtimestamp(x / 1e3).date().timetuple())
+    )
+    return (timeslots.to_numpy(), dates.to_numpy())
+
+def vectorized(timestamps: np.ndarray, period: int):
+    return (timestamps_to_timeslots(timestamps, period = period), encode_dates(timestamps))
+
+def main():
+    start = sys.argv[1] if len(sys.argv) > 1 else '2021-01-01'
+    end = sys.argv[2] if len(sys.argv) > 2 else '2021-12-31'
+    timestamps = synthetic_candles(start, end)
+    series = pd.Series(timestamps)
+    print('{0} one minute candles from {1} to {2}'.format(len(timestamps), start, end))
+
+    began = time.perf_counter()
+    expected = reference(series, 1)
+    reference_elapsed = time.perf_counter() - began
+
+    vectorized(timestamps[:1000], 1)
+    began = time.perf_counter()
+    result = vectorized(timestamps, 1)
+    vectorized_elapsed = time.perf_counter() - began
+
+    assert np.array_equal(expected[0], result[0])
+    assert np.array_equal(expected[1], result[1])
+    print('  per-row apply: {0:8.3f}s'.format(reference_elapsed))
+    print('  vectorized:    {0:8.3f}s ({1:.0f}x)'.format(
+        vectorized_elapsed, reference_elapsed / vectorized_elapsed
+    ))
+
+if __name__ == '__main__':
+    main()
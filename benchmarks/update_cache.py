@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+
+from typing import (
+    Any, Dict, Iterable, Iterator, Optional, Tuple
+)
+
+import numpy as np
+import pandas as pd
+
+import underdog.tasks.cache as cache
+
+from underdog.utility import (
+    encode_date,
+    nth_previous_trading_date
+)
+
+class MockProvider():
+
+    def __init__(self, latency: float, slots: int):
+        self._latency = latency
+        self._slots = slots
+        self._semaphore = threading.Semaphore(slots)
+        self._date = encode_date(nth_previous_trading_date(1))
+
+    def _call(self):
+        with self._semaphore:
+            time.sleep(self._latency)
+
+    def fetch_ticker_pages(self, symbols: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        pages = {}
+        for symbol in symbols:
+            self._call()
+            pages[symbol] = dict(details = dict(market_cap = 1), news = [])
+        return pages
+
+    def fetch_daily_many(self, starts: Dict[str, Any]) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+        for symbol in starts:
+            self._call()
+            yield (symbol, pd.DataFrame(
+                [[10., 11., 9., 10.5, 1000., self._date, 10.125]],
+                columns = ['open', 'high', 'low', 'close', 'volume', 'date', 'twap']
+            ))
+
+    def fetch_intraday_many(
+        self,
+        starts: Dict[str, Any],
+        period: int = 1
+    ) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+        slots = np.arange(960, dtype = np.float64)
+        for symbol in starts:
+            self._call()
+            yield (symbol, pd.DataFrame(
+                dict(
+                    timeslot = slots,
+                    open = 10., high = 11., low = 9., close = 10.5,
+                    volume = 100., twap = 10.125, date = self._date
+                ),
+                columns = ['timeslot', 'open', 'high', 'low', 'close', 'volume', 'twap', 'date']
+            ))
+
+def install(provider: MockProvider):
+    cache.fetch_ticker_pages = provider.fetch_ticker_pages
+    cache.fetch_daily_many = provider.fetch_daily_many
+    cache.fetch_intraday_many = provider.fetch_intraday_many
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+    slots = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    install(MockProvider(latency, slots))
+    stages = [cache.update_tickers, cache.update_daily, cache.update_intraday]
+    print('{0} symbols, {1:.0f}ms mocked latency, {2} provider slots'.format(
+        count, 1e3 * latency, slots
+    ))
+    for name, run in [
+        ('serial stages', lambda symbols: cache.update_symbols(symbols, stages, None)),
+        ('fanned out chunks', lambda symbols: cache.update_symbol_chunks(set(symbols), None))
+    ]:
+        symbols = ['{0}{1}'.format(name[0].upper(), i) for i in range(count)]
+        start = time.perf_counter()
+        run(symbols)
+        elapsed = time.perf_counter() - start
+        print('  {0:<18} {1:8.2f}s {2:8.1f} symbols/s'.format(name, elapsed, count / elapsed))
+        for symbol in symbols:
+            for path in ['cache/daily', 'cache/intraday/1', 'cache/intraday/5']:
+                cache.drop_history('/'.join([path, symbol]), None)
+            cache.drop_cached('cache/tickers/{0}'.format(symbol), None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+import os
+import tempfile
+
+os.environ.setdefault('PARKIT_DEFAULT_SITE_PATH', tempfile.mkdtemp())
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('parkit')
+
+import underdog.tasks.cache as cache
+
+from underdog.analysis.accessor import INTRADAY_DATE
+from underdog.utility import resample_intraday
+
+def _intraday(dates):
+    rows = []
+    for date in dates:
+        prices = np.linspace(10., 20., 960)
+        rows.append(np.column_stack([
+            np.arange(960, dtype = np.float64),
+            prices, prices + 1., prices - 1., prices,
+            np.full(960, 100.),
+            prices,
+            np.full(960, date)
+        ]))
+    return np.concatenate(rows)
+
+def test_update_intraday_skips_covered_five_minute_days(monkeypatch):
+    dates = [1.6e9, 1.6e9 + 86400, 1.6e9 + 2 * 86400]
+    array = _intraday(dates)
+    written = {}
+    monkeypatch.setattr(cache, 'plan_fetch', lambda symbols, dataset, site_uuid: {'SYM': None})
+    monkeypatch.setattr(
+        cache, 'fetch_intraday_many',
+        lambda starts, period: iter([('SYM', pd.DataFrame(array))])
+    )
+    monkeypatch.setattr(
+        cache, 'manifest_entry',
+        lambda path, site_uuid: dict(last = dates[1]) if path == 'cache/intraday/5/SYM' else None
+    )
+    monkeypatch.setattr(
+        cache, 'extend_history',
+        lambda path, array, site_uuid: written.setdefault(path, array)
+    )
+    monkeypatch.setattr(cache, 'manifest_entries', lambda dataset, site_uuid: {'SYM': {}})
+    cache.update_intraday({'SYM'}, None)
+    assert np.array_equal(written['cache/intraday/1/SYM'], array)
+    five = written['cache/intraday/5/SYM']
+    assert np.array_equal(np.unique(five[:, INTRADAY_DATE]), [dates[2]])
+    assert np.array_equal(five, resample_intraday(array, 5)[-192:])
+
+def test_update_intraday_skips_five_minute_history_ahead(monkeypatch):
+    dates = [1.6e9, 1.6e9 + 86400]
+    written = {}
+    monkeypatch.setattr(cache, 'plan_fetch', lambda symbols, dataset, site_uuid: {'SYM': None})
+    monkeypatch.setattr(
+        cache, 'fetch_intraday_many',
+        lambda starts, period: iter([('SYM', pd.DataFrame(_intraday(dates)))])
+    )
+    monkeypatch.setattr(
+        cache, 'manifest_entry',
+        lambda path, site_uuid: dict(last = dates[1] + 86400) \
+        if path == 'cache/intraday/5/SYM' else None
+    )
+    monkeypatch.setattr(
+        cache, 'extend_history',
+        lambda path, array, site_uuid: written.setdefault(path, array)
+    )
+    monkeypatch.setattr(cache, 'manifest_entries', lambda dataset, site_uuid: {'SYM': {}})
+    cache.update_intraday({'SYM'}, None)
+    assert 'cache/intraday/1/SYM' in written
+    assert 'cache/intraday/5/SYM' not in written
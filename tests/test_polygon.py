@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip('parkit')
+
+from underdog.analysis.accessor import (
+    MARKET_CLOSE,
+    MARKET_SYMBOL
+)
+from underdog.polygon.fetch import decode_grouped_daily
+from underdog.utility import (
+    decode_symbols,
+    encodable_symbols
+)
+
+def _row(symbol, close):
+    return dict(T = symbol, v = 1000., vw = close, o = close, c = close, h = close, l = close)
+
+def test_encodable_symbols():
+    assert list(encodable_symbols(['AAPL', 'BRK.A', 'spy', 'BAD$', 'TOOLONGSYMBOL', 'É', ''])) == \
+    [True, True, True, False, False, False, True]
+
+def test_decode_grouped_daily_drops_unencodable_symbols():
+    array = decode_grouped_daily(
+        [_row('MSFT', 2.), _row('BAD$', 3.), _row('AAPL', 1.), _row(None, 4.)],
+        1.6e9
+    )
+    assert sorted(decode_symbols(array[:, MARKET_SYMBOL])) == ['AAPL', 'MSFT']
+    assert sorted(array[:, MARKET_CLOSE]) == [1., 2.]
+    assert decode_grouped_daily([_row('BAD$', 3.)], 1.6e9) is None
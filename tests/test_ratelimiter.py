@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import uuid
+
+import pytest
+
+pytest.importorskip('parkit')
+
+import underdog.constants as constants
+
+from underdog.ratelimiter import RateLimiter
+
+@pytest.fixture
+def limiter():
+    return RateLimiter(str(uuid.uuid4()), 0.01, 4)
+
+def test_try_request_errors_reach_limiter(limiter):
+    for context in limiter.try_request(3):
+        with context:
+            raise ValueError(context.attempts)
+    assert limiter.failed
+    assert limiter.attempts == 3
+    assert [str(error) for error in limiter.errors] == ['1', '2', '3']
+    for context in limiter.try_request(2):
+        with context:
+            pass
+        break
+    assert not limiter.failed
+    assert limiter.errors == []
+
+def test_errors_are_bounded(limiter):
+    for i in range(constants.RATE_LIMITER_MAX_ERRORS + 10):
+        with limiter:
+            raise ValueError(i)
+    assert len(limiter.errors) == constants.RATE_LIMITER_MAX_ERRORS
+    assert str(limiter.errors[-1]) == str(constants.RATE_LIMITER_MAX_ERRORS + 9)
+
+def test_exit_suppresses_exceptions(limiter):
+    with limiter:
+        raise ValueError()
+    async def run():
+        async with limiter:
+            raise ValueError()
+    asyncio.run(run())
+    assert len(limiter.errors) == 2
+    with pytest.raises(KeyboardInterrupt):
+        with limiter:
+            raise KeyboardInterrupt()
+
+def test_window_is_thread_safe():
+    limiter = RateLimiter(str(uuid.uuid4()), 0.02, 2)
+    entries = []
+    def worker():
+        for _ in range(5):
+            entry_id = limiter.acquire()
+            entries.append(entry_id[1])
+            limiter.release(entry_id)
+    threads = [threading.Thread(target = worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    entries.sort()
+    assert len(entries) == 40
+    assert all(
+        entries[i + limiter.maxsize] - entries[i] > limiter.interval * 1e9
+        for i in range(len(entries) - limiter.maxsize)
+    )
@@ -0,0 +1,117 @@
+import datetime
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('parkit')
+
+import underdog.storage as storage
+
+from underdog.analysis.accessor import DAILY_CLOSE
+
+def _daily(dates):
+    prices = np.linspace(10., 20., len(dates))
+    return np.column_stack([
+        prices, prices + 1., prices - 1., prices,
+        np.full(len(dates), 100.),
+        np.asarray(dates, dtype = np.float64),
+        prices
+    ])
+
+@pytest.fixture
+def history(monkeypatch):
+    monkeypatch.setattr(storage.constants, 'HISTORY_SEGMENT_ROWS', 5)
+    path = 'cache/daily/TESTRANGE'
+    array = _daily(1.6e9 + 86400. * np.arange(40))
+    storage.write_history(path, array[:20])
+    for offset in range(20, 40, 5):
+        storage.append_history(path, array[offset:offset + 5])
+    yield path, array
+    storage.drop_history(path)
+
+def _count_opens(monkeypatch):
+    opened = []
+    open_array = storage._open_array
+    def counting(name, site_uuid):
+        opened.append(name)
+        return open_array(name, site_uuid)
+    monkeypatch.setattr(storage, '_open_array', counting)
+    return opened
+
+def test_read_range_skips_base_outside_window(history, monkeypatch):
+    path, array = history
+    opened = _count_opens(monkeypatch)
+    result = storage._read_range(path, array[30, 5], array[33, 5], None, None)
+    assert np.array_equal(result, array[30:34])
+    assert path not in opened
+    assert len(opened) == 1
+
+def test_tail_history_opens_each_part_once(history, monkeypatch):
+    path, array = history
+    opened = _count_opens(monkeypatch)
+    result = storage.tail_history(path, 8, columns = [DAILY_CLOSE])
+    assert np.array_equal(result, array[-8:, [DAILY_CLOSE]])
+    assert len(opened) == len(set(opened)) == 2
+
+def test_merge_history_keeps_base_window(history):
+    path, array = history
+    storage.merge_history(path)
+    assert storage.history_segments(path) == []
+    assert np.array_equal(storage.read_history(path), array)
+    assert np.array_equal(storage._read_range(path, array[25, 5], None, None, None), array[25:])
+
+def test_append_history_coalesces_segments(monkeypatch):
+    monkeypatch.setattr(storage.constants, 'HISTORY_SEGMENT_ROWS', 10)
+    path = 'cache/daily/TESTCOALESCE'
+    array = _daily(1.6e9 + 86400. * np.arange(40))
+    try:
+        storage.write_history(path, array[:20])
+        counts = [
+            storage.append_history(path, array[offset:offset + 5])
+            for offset in range(20, 40, 5)
+        ]
+        assert counts == [1, 1, 2, 2]
+        segments = storage.history_segments(path)
+        assert [segment['rows'] for segment in segments] == [10, 10]
+        entry = storage.manifest_entry(path)
+        assert entry['rows'] == 40
+        assert entry['bytes'] == array[:20].nbytes + sum(segment['bytes'] for segment in segments)
+        assert np.array_equal(storage.read_history(path), array)
+        storage.append_history(path, array[:1])
+        assert len(storage.history_segments(path)) == 3
+    finally:
+        storage.drop_history(path)
+
+def test_columnar_format_is_opt_in(monkeypatch):
+    path = 'cache/daily/TESTCOLUMNAR'
+    array = _daily(1.6e9 + 86400. * np.arange(10))
+    try:
+        storage.write_history(path, array)
+        assert storage.manifest_entry(path)['content_type'] == storage.NDARRAY_CONTENT_TYPE
+        monkeypatch.setattr(storage.constants, 'CACHE_COLUMNAR_FORMAT', True)
+        storage.append_history(path, array[-1:] + [0., 0., 0., 0., 0., 86400., 0.])
+        content = storage.File(
+            storage.history_segments(path)[0]['name'], create = False, bind = True
+        ).get_content()
+        assert isinstance(content, bytes)
+        assert np.array_equal(storage.read_history(path)[:10], array)
+    finally:
+        storage.drop_history(path)
+
+def test_modified_time_matches_epoch(monkeypatch):
+    if not hasattr(time, 'tzset'):
+        pytest.skip('requires time.tzset')
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    try:
+        now = time.time()
+        local = datetime.datetime.fromtimestamp(now)
+        assert storage._modified_time(local) == pytest.approx(now)
+        assert storage._modified_time(local.isoformat()) == pytest.approx(now)
+        assert storage._modified_time(
+            datetime.datetime.fromtimestamp(now, datetime.timezone.utc)
+        ) == pytest.approx(now)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
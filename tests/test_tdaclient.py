@@ -0,0 +1,32 @@
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+pytest.importorskip('parkit')
+
+from underdog.tda.tdaclient import TDA
+
+def test_threads_share_one_login(monkeypatch):
+    logins = []
+    def client_from_token_file(token_path, api_key):
+        logins.append(threading.get_ident())
+        time.sleep(0.05)
+        return object()
+    auth = types.ModuleType('tda.auth')
+    auth.client_from_token_file = client_from_token_file
+    package = types.ModuleType('tda')
+    package.auth = auth
+    monkeypatch.setitem(sys.modules, 'tda', package)
+    monkeypatch.setitem(sys.modules, 'tda.auth', auth)
+    tda = TDA()
+    clients = []
+    threads = [threading.Thread(target = lambda: clients.append(tda.api)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(logins) == 1
+    assert len(clients) == 4 and all(client is clients[0] for client in clients)
@@ -1,5 +1,10 @@
+import importlib
 import os
 
+from typing import (
+    Any, List
+)
+
 assert 'PARKIT_DEFAULT_SITE_PATH' in os.environ
 
 from underdog.analysis.accessor import (
@@ -17,36 +22,101 @@ from underdog.analysis.accessor import (
     INTRADAY_CLOSE,
     INTRADAY_VOLUME,
     INTRADAY_TWAP,
-    INTRADAY_DATE
-)
-from underdog.analysis.groupby import groupby_date
-from underdog.analysis.stdlib import (
-    mapframe,
-    maptable
+    INTRADAY_DATE,
+    MARKET_SYMBOL,
+    MARKET_VOLUME,
+    MARKET_VWAP,
+    MARKET_OPEN,
+    MARKET_CLOSE,
+    MARKET_HIGH,
+    MARKET_LOW,
+    MARKET_DATE,
+    MARKET_TWAP
 )
+_lazy_modules = {
+    'underdog.analysis.columnar': [
+        'ColumnarArray'
+    ],
+    'underdog.analysis.groupby': [
+        'groupby_date'
+    ],
+    'underdog.analysis.stdlib': [
+        'mapframe',
+        'maptable'
+    ],
+    'underdog.storage': [
+        'open_history',
+        'read_daily',
+        'read_history',
+        'read_history_range',
+        'read_intraday',
+        'read_market',
+        'tail_daily',
+        'tail_history',
+        'tail_intraday'
+    ],
+    'underdog.tradingcalendar': [
+        'TradingCalendar'
+    ],
+    'underdog.tasks.cache': [
+        'compact_cache',
+        'update_cache'
+    ],
+    'underdog.tasks.realtime': [
+        'get_intraday',
+        'realtime_stream'
+    ],
+    'underdog.utility': [
+        'as_pandas',
+        'decode_date',
+        'decode_symbol',
+        'decode_symbols',
+        'isfinite',
+        'is_trading_date',
+        'market_close',
+        'market_close_table',
+        'nth_next_trading_date',
+        'nth_previous_trading_date',
+        'encode_date',
+        'encode_dates',
+        'encode_symbol',
+        'encode_symbols',
+        'resample_intraday',
+        'timestamp_to_timeslot',
+        'timestamps_to_timeslots',
+        'timeslot_to_timestamp',
+        'trading_calendar',
+        'trading_days_between',
+        'trading_daterange',
+        'twap',
+        'twap_into',
+        'twap_value'
+    ],
+    'underdog.polygon.tickers': [
+        'fetch_tickers',
+        'lookup_exchange',
+        'lookup_ticker',
+        'sync_tickers'
+    ]
+}
 
-from underdog.tasks.cache import update_cache
-from underdog.tasks.realtime import (
-    get_intraday,
-    realtime_stream
-)
+_lazy_names = {
+    name: module
+    for module, names in _lazy_modules.items()
+    for name in names
+}
 
-from underdog.utility import (
-    as_pandas,
-    decode_date,
-    decode_symbol,
-    isfinite,
-    is_trading_date,
-    market_close,
-    market_close_table,
-    nth_next_trading_date,
-    nth_previous_trading_date,
-    encode_date,
-    encode_symbol,
-    timestamp_to_timeslot,
-    timeslot_to_timestamp,
-    trading_days_between,
-    trading_daterange
-)
+__all__ = [
+    name for name in globals()
+    if name.isupper() and not name.startswith('_')
+] + list(_lazy_names)
+
+def __getattr__(name: str) -> Any:
+    if name in _lazy_names:
+        value = getattr(importlib.import_module(_lazy_names[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {0} has no attribute {1}'.format(__name__, name))
 
-from underdog.polygon.tickers import fetch_tickers
+def __dir__() -> List[str]:
+    return sorted(set(globals()).union(_lazy_names))
@@ -18,3 +18,13 @@ DAILY_CLOSE: int = 3
 DAILY_VOLUME: int = 4
 DAILY_DATE: int = 5
 DAILY_TWAP: int = 6
+
+MARKET_SYMBOL: int = 0
+MARKET_VOLUME: int = 1
+MARKET_VWAP: int = 2
+MARKET_OPEN: int = 3
+MARKET_CLOSE: int = 4
+MARKET_HIGH: int = 5
+MARKET_LOW: int = 6
+MARKET_DATE: int = 7
+MARKET_TWAP: int = 8
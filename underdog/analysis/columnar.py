@@ -0,0 +1,201 @@
+import logging
+import struct
+
+from typing import (
+    Any, Iterable, List, Optional, Union
+)
+
+import numpy as np
+
+from underdog.analysis.accessor import (
+    DAILY_DATE,
+    DAILY_VOLUME,
+    INTRADAY_DATE,
+    INTRADAY_TIMESLOT,
+    INTRADAY_VOLUME,
+    MARKET_DATE,
+    MARKET_SYMBOL,
+    MARKET_VOLUME
+)
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_MAGIC: bytes = b'UDC1'
+
+PRICE: int = 0
+INTEGER: int = 1
+COUNT: int = 2
+RAW: int = 3
+
+_header = struct.Struct('<4sII')
+
+_dtypes = {
+    b'f4': np.dtype('<f4'),
+    b'f8': np.dtype('<f8'),
+    b'i4': np.dtype('<i4'),
+    b'u4': np.dtype('<u4')
+}
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+def column_kinds(size: int) -> List[int]:
+    kinds = [PRICE] * size
+    if size == 7:
+        kinds[DAILY_VOLUME] = COUNT
+        kinds[DAILY_DATE] = INTEGER
+    elif size == 8:
+        kinds[INTRADAY_TIMESLOT] = INTEGER
+        kinds[INTRADAY_VOLUME] = COUNT
+        kinds[INTRADAY_DATE] = INTEGER
+    elif size == 9:
+        kinds[MARKET_SYMBOL] = RAW
+        kinds[MARKET_VOLUME] = COUNT
+        kinds[MARKET_DATE] = INTEGER
+    else:
+        kinds = [RAW] * size
+    return kinds
+
+def compact_dtype(values: np.ndarray, kind: int) -> np.dtype:
+    if len(values) == 0 or kind == RAW:
+        return _dtypes[b'f8']
+    if kind == PRICE:
+        with np.errstate(over = 'ignore', invalid = 'ignore'):
+            restored = np.round(values.astype(np.float32).astype(np.float64), 2)
+        if np.array_equal(restored, values, equal_nan = True):
+            return _dtypes[b'f4']
+        return _dtypes[b'f8']
+    if not np.isfinite(values).all() or (values != np.trunc(values)).any():
+        return _dtypes[b'f8']
+    if kind == INTEGER and \
+    values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max:
+        return _dtypes[b'i4']
+    if kind == COUNT and values.min() >= 0 and values.max() <= np.iinfo(np.uint32).max:
+        return _dtypes[b'u4']
+    return _dtypes[b'f8']
+
+def decode_column(
+    column: np.ndarray,
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    if column.dtype == np.float32:
+        return np.round(column.astype(np.float64), 2, out = out)
+    if out is None:
+        return column.astype(np.float64)
+    out[:] = column
+    return out
+
+def is_columnar(content: Any) -> bool:
+    return isinstance(content, (bytes, bytearray, memoryview)) and \
+    bytes(memoryview(content)[:len(COLUMNAR_MAGIC)]) == COLUMNAR_MAGIC
+
+class ColumnarArray():
+
+    def __init__(self, columns: List[np.ndarray]):
+        if len({len(column) for column in columns}) > 1:
+            raise ValueError()
+        self._columns = columns
+
+    @classmethod
+    def frombuffer(cls, buffer: Union[bytes, bytearray, memoryview]) -> 'ColumnarArray':
+        magic, rows, size = _header.unpack_from(buffer, 0)
+        if magic != COLUMNAR_MAGIC:
+            raise ValueError()
+        codes = bytes(memoryview(buffer)[_header.size:_header.size + 2 * size])
+        offset = _align(_header.size + 2 * size)
+        columns = []
+        for i in range(size):
+            dtype = _dtypes[codes[2 * i:2 * i + 2]]
+            columns.append(np.frombuffer(buffer, dtype = dtype, count = rows, offset = offset))
+            offset = _align(offset + rows * dtype.itemsize)
+        return cls(columns)
+
+    @classmethod
+    def fromarray(cls, array: np.ndarray, compact: bool = True) -> 'ColumnarArray':
+        if not compact:
+            return cls([array[:, i] for i in range(array.shape[1])])
+        return cls([
+            np.ascontiguousarray(array[:, i]).astype(
+                compact_dtype(array[:, i], kind), copy = False
+            )
+            for i, kind in enumerate(column_kinds(array.shape[1]))
+        ])
+
+    def tobuffer(self) -> memoryview:
+        offset = _align(_header.size + 2 * len(self._columns))
+        offsets = []
+        for column in self._columns:
+            offsets.append(offset)
+            offset = _align(offset + len(self) * _dtypes[column.dtype.str[1:].encode()].itemsize)
+        buffer = bytearray(offset)
+        _header.pack_into(buffer, 0, COLUMNAR_MAGIC, len(self), len(self._columns))
+        buffer[_header.size:_header.size + 2 * len(self._columns)] = b''.join(
+            column.dtype.str[1:].encode() for column in self._columns
+        )
+        for column, start in zip(self._columns, offsets):
+            np.frombuffer(
+                buffer, dtype = column.dtype.newbyteorder('<'),
+                count = len(self), offset = start
+            )[:] = column
+        return memoryview(buffer)
+
+    def __len__(self) -> int:
+        return len(self._columns[0]) if len(self._columns) > 0 else 0
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self), len(self._columns))
+
+    @property
+    def dtypes(self) -> List[np.dtype]:
+        return [column.dtype for column in self._columns]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns)
+
+    def raw(self, index: int) -> np.ndarray:
+        return self._columns[index]
+
+    def column(
+        self,
+        index: int,
+        start: Optional[int] = None,
+        stop: Optional[int] = None
+    ) -> np.ndarray:
+        return decode_column(self._columns[index][start:stop])
+
+    def as_numpy(
+        self,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+        columns: Optional[Iterable[int]] = None
+    ) -> np.ndarray:
+        indexes = list(range(len(self._columns))) if columns is None else list(columns)
+        start, stop, _ = slice(start, stop).indices(len(self))
+        array = np.empty((max(0, stop - start), len(indexes)), dtype = np.float64)
+        for i, index in enumerate(indexes):
+            decode_column(self._columns[index][start:stop], out = array[:, i])
+        return array
+
+    def __array__(self, dtype: Optional[Any] = None, copy: Optional[bool] = None) -> np.ndarray:
+        array = self.as_numpy()
+        return array if dtype is None else array.astype(dtype, copy = False)
+
+    def slice(self, start: Optional[int], stop: Optional[int]) -> 'ColumnarArray':
+        return ColumnarArray([column[start:stop] for column in self._columns])
+
+    def take(self, indexes: np.ndarray) -> 'ColumnarArray':
+        return ColumnarArray([column[indexes] for column in self._columns])
+
+def concatenate_columnar(parts: List[ColumnarArray]) -> ColumnarArray:
+    if len(parts) == 1:
+        return parts[0]
+    columns = []
+    for i in range(parts[0].shape[1]):
+        raws = [part.raw(i) for part in parts]
+        if len({raw.dtype for raw in raws}) == 1:
+            columns.append(np.concatenate(raws))
+        else:
+            columns.append(np.concatenate([decode_column(raw) for raw in raws]))
+    return ColumnarArray(columns)
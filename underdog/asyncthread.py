@@ -1,15 +1,16 @@
 import asyncio
 import concurrent
 import enum
+import importlib.util
 import logging
-import selectors
 import threading
-import time
 
 from typing import (
-    Any, Awaitable, cast, Optional
+    Any, Awaitable, Callable, cast, Optional
 )
 
+import underdog.constants as constants
+
 logger = logging.getLogger(__name__)
 
 class AsyncThreadState(enum.Enum):
@@ -17,13 +18,32 @@ class AsyncThreadState(enum.Enum):
     Started = 2
     Stopped = 3
 
+def selector_loop_factory() -> asyncio.AbstractEventLoop:
+    return asyncio.SelectorEventLoop()
+
+def uvloop_loop_factory() -> asyncio.AbstractEventLoop:
+    import uvloop
+    return uvloop.new_event_loop()
+
+def default_loop_factory() -> Callable[[], asyncio.AbstractEventLoop]:
+    if constants.ASYNC_THREAD_USE_UVLOOP and importlib.util.find_spec('uvloop') is not None:
+        return uvloop_loop_factory
+    return selector_loop_factory
+
 class AsyncThread(threading.Thread):
 
-    def __init__(self, interrupt: Optional[float] = None):
+    def __init__(
+        self,
+        interrupt: Optional[float] = None,
+        loop_factory: Optional[Callable[[], asyncio.AbstractEventLoop]] = None
+    ):
         super().__init__()
         self._loop: Any = None
         self._state: AsyncThreadState = AsyncThreadState.Created
         self._interrupt = interrupt
+        self._loop_factory = default_loop_factory() if loop_factory is None else loop_factory
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
 
     @property
     def state(self) -> AsyncThreadState:
@@ -32,11 +52,12 @@ class AsyncThread(threading.Thread):
     def start(self) -> None:
         assert self._state == AsyncThreadState.Created
         super().start()
-        while self._loop is None or not self._loop.is_running():
-            time.sleep(0)
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
         self._state = AsyncThreadState.Started
         if self._interrupt is not None:
-            self._loop.call_later(self._interrupt, self.interrupt)
+            self._loop.call_soon_threadsafe(self._loop.call_later, self._interrupt, self.interrupt)
 
     def interrupt(self):
         self.on_interrupt_event()
@@ -84,8 +105,14 @@ class AsyncThread(threading.Thread):
 
     def run(self) -> None:
         try:
-            selector = selectors.SelectSelector()
-            self._loop = asyncio.SelectorEventLoop(selector)
+            self._loop = self._loop_factory()
+            asyncio.set_event_loop(self._loop)
+        except BaseException as exc:
+            self._error = exc
+            self._ready.set()
+            return
+        try:
+            self._loop.call_soon(self._ready.set)
             self._loop.run_forever()
         finally:
             self._loop.run_until_complete(self._loop.shutdown_asyncgens())
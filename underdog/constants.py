@@ -1,12 +1,18 @@
 
 FINVIZ_REQUEST_INTERVAL: float = 1.
 FINVIZ_MAX_REQUESTS_PER_INTERVAL: int = 4
+FINVIZ_MAX_REQUESTS_CEILING: int = 8
+FINVIZ_ADAPTIVE_RATE_LIMIT: bool = True
 FINVIZ_FETCH_RETRY_LIMIT: int = 2
+FINVIZ_FETCH_BATCH_SIZE: int = 64
 
 POLYGON_API_KEY_ENVNAME: str = 'POLYGON_API_KEY'
 POLYGON_REQUEST_INTERVAL: float = 12.
 POLYGON_MAX_REQUESTS_PER_INTERVAL: int = 1
+POLYGON_MAX_REQUESTS_CEILING: int = 100
+POLYGON_ADAPTIVE_RATE_LIMIT: bool = True
 POLYGON_FETCH_RETRY_LIMIT: int = 3
+POLYGON_FETCH_CONCURRENCY: int = 8
 
 TDA_TOKEN_PATH_ENVNAME: str = 'TDA_TOKEN_PATH'
 TDA_API_KEY_ENVNAME: str = 'TDA_API_KEY'
@@ -14,10 +20,31 @@ TDA_REDIRECT_URI_ENVNAME: str = 'TDA_REDIRECT_URI'
 TDA_ACCOUNT_ID_ENVNAME: str = 'TDA_ACCOUNT_ID'
 TDA_REQUEST_INTERVAL: float = 1.
 TDA_MAX_REQUESTS_PER_INTERVAL: int = 2
+TDA_MAX_REQUESTS_CEILING: int = 4
+TDA_ADAPTIVE_RATE_LIMIT: bool = True
 TDA_FETCH_RETRY_LIMIT: int = 3
+TDA_FETCH_CONCURRENCY: int = 4
+TDA_PARSE_CONCURRENCY: int = 2
 TDA_MAX_REALTIME_SYMBOLS: int = 300
 
 DEFAULT_TRADE_BUFFER_SIZE: int = 100000000
 
+RATE_LIMITER_MAX_ERRORS: int = 100
+
 MARKET_CALENDAR_START_DATE: str = '1990-01-01'
 MARKET_CALENDAR_END_DATE: str = '2030-01-01'
+
+HISTORY_SEGMENT_ROWS: int = 20000
+HISTORY_MERGE_SEGMENTS: int = 16
+CACHE_COLUMNAR_FORMAT: bool = False
+
+ASYNC_THREAD_USE_UVLOOP: bool = False
+
+HTTP_CONNECTIONS_PER_HOST: int = 8
+HTTP_DNS_CACHE_TTL: int = 300
+HTTP_KEEPALIVE_TIMEOUT: float = 30.
+HTTP_CACHE_MAX_BYTES: int = 536870912
+
+FINVIZ_CACHE_TTL: float = 86400.
+POLYGON_MARKET_CACHE_TTL: float = 2592000.
+POLYGON_TICKERS_CACHE_TTL: float = 86400.
@@ -0,0 +1,80 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import urllib.parse
+
+from typing import (
+    Any, Awaitable, Dict, Optional
+)
+
+import aiohttp
+
+import underdog.constants as constants
+
+from underdog.asyncthread import (
+    AsyncThread,
+    AsyncThreadState
+)
+
+logger = logging.getLogger(__name__)
+
+class LoopService(AsyncThread):
+
+    def __init__(self):
+        super().__init__()
+        self.daemon = True
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def session(self, url: str) -> aiohttp.ClientSession:
+        assert asyncio.get_running_loop() is self._loop
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self._sessions or self._sessions[host].closed:
+            self._sessions[host] = aiohttp.ClientSession(
+                connector = aiohttp.TCPConnector(
+                    limit_per_host = constants.HTTP_CONNECTIONS_PER_HOST,
+                    ttl_dns_cache = constants.HTTP_DNS_CACHE_TTL,
+                    keepalive_timeout = constants.HTTP_KEEPALIVE_TIMEOUT
+                )
+            )
+        return self._sessions[host]
+
+    async def _stop_(self) -> None:
+        try:
+            for session in self._sessions.values():
+                await session.close()
+            self._sessions.clear()
+        finally:
+            await super()._stop_()
+
+_lock = threading.Lock()
+
+_service: Optional[LoopService] = None
+
+_service_pid: Optional[int] = None
+
+def loop_service() -> LoopService:
+    global _service, _service_pid
+    with _lock:
+        if _service is None or _service_pid != os.getpid() or \
+        _service.state != AsyncThreadState.Started:
+            _service = LoopService()
+            _service.start()
+            _service_pid = os.getpid()
+        return _service
+
+def run_task(coro: Awaitable[Any]) -> Any:
+    return loop_service().run_task(coro)
+
+def client_session(url: str) -> aiohttp.ClientSession:
+    return loop_service().session(url)
+
+@atexit.register
+def shutdown() -> None:
+    global _service
+    with _lock:
+        if _service is not None and _service_pid == os.getpid() and \
+        _service.state == AsyncThreadState.Started:
+            _service.stop()
+        _service = None
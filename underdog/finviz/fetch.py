@@ -1,17 +1,29 @@
+import asyncio
 import datetime
 import logging
+import re
 
 from typing import (
-   Any, Dict, List, Optional, Union
+   Any, Dict, Iterable, List, Optional, Union
 )
 
-import aiohttp
-from lxml import html
+from lxml import (
+    etree,
+    html
+)
 
 import underdog.constants as constants
 
-from underdog.asyncthread import AsyncThread
-from underdog.ratelimiter import RateLimiter
+from underdog.eventloop import (
+    client_session,
+    run_task
+)
+from underdog.httpcache import response_cache
+from underdog.ratelimiter import (
+    parse_retry_after,
+    RateLimiter,
+    RateLimitExceeded
+)
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +41,9 @@ _headers = {
 rate_limiter = RateLimiter(
     'finviz_rate_limiter',
     constants.FINVIZ_REQUEST_INTERVAL,
-    constants.FINVIZ_MAX_REQUESTS_PER_INTERVAL
+    constants.FINVIZ_MAX_REQUESTS_PER_INTERVAL,
+    adaptive = constants.FINVIZ_ADAPTIVE_RATE_LIMIT,
+    ceiling = constants.FINVIZ_MAX_REQUESTS_CEILING
 )
 
 def _parse_stock_data_field(
@@ -69,7 +83,7 @@ def safe_round(value: Optional[float], places: int = 0) -> Optional[float]:
         return value
     return round(value, places)
 
-async def _to_dict(data: Dict[str, str]) -> Dict[str, Optional[Union[float, bool, int]]]:
+def _to_dict(data: Dict[str, str]) -> Dict[str, Optional[Union[float, bool, int]]]:
     insider_ownership = safe_round(_parse_stock_data_field(data, float, 'Insider Own'), 2)
     institutional_ownership = safe_round(_parse_stock_data_field(data, float, 'Inst Own'), 2)
     if insider_ownership is None or institutional_ownership is None:
@@ -91,95 +105,140 @@ async def _to_dict(data: Dict[str, str]) -> Dict[str, Optional[Union[float, bool
         is_shortable = _parse_stock_data_field(data, bool, 'Shortable')
     )
 
+_snapshot_marker = 'snapshot-table2'
+
+_news_marker = 'id="news-table"'
+
+_table_tag = re.compile(r'<(/?)table\b', re.IGNORECASE)
+
+_snapshot_rows = etree.XPath('//tr[@class="table-dark-row"]')
+
+_snapshot_cells = etree.XPath('td//text()')
+
+_news_links = etree.XPath('//a[@class="tab-link-news"]')
+
+_news_row = etree.XPath('ancestor::tr[1]')
+
+_news_headline = etree.XPath('text()')
+
+def _table_fragment(text: str, marker: str) -> Optional[str]:
+    index = text.find(marker)
+    if index < 0:
+        return None
+    start = text.rfind('<table', 0, index)
+    if start < 0:
+        return None
+    depth = 0
+    for match in _table_tag.finditer(text, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            end = text.find('>', match.end())
+            return text[start:end + 1] if end >= 0 else None
+    return None
+
+def _parse_details(page: Any) -> Dict[str, Optional[Union[float, bool, int]]]:
+    data = {}
+    for row in _snapshot_rows(page):
+        cells = _snapshot_cells(row)
+        for column in range(0, 11, 2):
+            data[cells[column]] = cells[column + 1]
+    return _to_dict(data)
+
+def _parse_news(page: Any) -> List[Dict[str, Any]]:
+    items = []
+    day = ''
+    for link in _news_links(page):
+        date_str = _news_row(link)[0][0].text.strip()
+        if ' ' in date_str:
+            day = date_str.split(' ')[0]
+        else:
+            date_str = ' '.join([day, date_str])
+        items.append(dict(
+            date = str(datetime.datetime.strptime(date_str, "%b-%d-%y %I:%M%p")),
+            headline = _news_headline(link)[0],
+            url = link.get('href')
+        ))
+    return items
+
+def _parse_page(symbol: str, text: str) -> Dict[str, Any]:
+    page = None
+    result: Dict[str, Any] = dict(details = None, news = None)
+    for key, marker, parser in [
+        ('details', _snapshot_marker, _parse_details),
+        ('news', _news_marker, _parse_news)
+    ]:
+        fragment = _table_fragment(text, marker)
+        if fragment is not None:
+            try:
+                result[key] = parser(html.fromstring(fragment))
+                if result[key]:
+                    continue
+            except (AttributeError, IndexError, KeyError, ValueError):
+                pass
+        try:
+            if page is None:
+                page = html.fromstring(text)
+            result[key] = parser(page)
+        except (AttributeError, IndexError, KeyError, ValueError) as exc:
+            logger.error('error parsing ticker %s for %s: %s', key, symbol, str(exc))
+    return result
+
+def fetch_ticker_page(symbol: str) -> Dict[str, Any]:
+    return run_task(async_fetch_ticker_page(symbol))
+
+def fetch_ticker_pages(symbols: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    return run_task(async_fetch_ticker_pages(symbols))
+
+async def async_fetch_ticker_pages(symbols: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    symbols = list(symbols)
+    pages = await asyncio.gather(*[
+        async_fetch_ticker_page(symbol) for symbol in symbols
+    ])
+    return dict(zip(symbols, pages))
+
+async def async_fetch_ticker_page(symbol: str) -> Dict[str, Any]:
+    params = {'t': symbol}
+    cached = response_cache().lookup(_stock_url, params)
+    if cached is not None:
+        result = _parse_page(symbol, cached.text)
+        if result['details'] is not None or result['news'] is not None:
+            return result
+        response_cache().invalidate(_stock_url, params)
+    context = None
+    session = client_session(_stock_url)
+    async for context in rate_limiter.try_request_async(
+        constants.FINVIZ_FETCH_RETRY_LIMIT
+    ):
+        async with context:
+            response = await response_cache().fetch(
+                session, _stock_url,
+                params = params,
+                headers = _headers,
+                ttl = constants.FINVIZ_CACHE_TTL
+            )
+            if response.status == 200:
+                return _parse_page(symbol, response.text)
+            if response.status == 404:
+                return dict(details = None, news = None)
+            if response.status == 429:
+                raise RateLimitExceeded(
+                    'Server response code {0}'.format(response.status),
+                    parse_retry_after(response.headers.get('Retry-After'))
+                )
+            raise RuntimeError('Server response code {0}'.format(response.status))
+    logger.error('error fetching ticker page for %s: %s', symbol, str(context.errors[-1]))
+    return dict(details = None, news = None)
+
 def fetch_ticker_details(symbol: str) -> Optional[Dict[str, Optional[Union[float, bool, int]]]]:
-    try:
-        thread = AsyncThread()
-        thread.start()
-        return thread.run_task(async_fetch_ticker_details(symbol))
-    finally:
-        thread.stop()
+    return run_task(async_fetch_ticker_details(symbol))
 
 async def async_fetch_ticker_details(
     symbol: str
 ) -> Optional[Dict[str, Optional[Union[float, bool, int]]]]:
-    context = None
-    async with aiohttp.ClientSession() as session:
-        for context in rate_limiter.try_request(
-            constants.FINVIZ_FETCH_RETRY_LIMIT
-        ):
-            with context:
-                async with session.get(
-                    _stock_url, headers = _headers, params = {'t': symbol}
-                ) as response:
-                    if response.status == 200:
-                        page = html.fromstring(await response.text())
-                        data = {}
-                        all_rows = [
-                            row.xpath('td//text()')
-                            for row in page.cssselect('tr[class="table-dark-row"]')
-                        ]
-                        for row in all_rows:
-                            for column in range(0, 11):
-                                if column % 2 == 0:
-                                    data[row[column]] = row[column + 1]
-                        return await _to_dict(data)
-                    if response.status == 404:
-                        return None
-                    raise RuntimeError('Server response code {0}'.format(response.status))
-    logger.error('error fetching ticker details for %s: %s', symbol, str(context.errors[-1]))
-    return None
+    return (await async_fetch_ticker_page(symbol))['details']
 
 def fetch_ticker_news(symbol: str) -> Optional[List[Dict[str, Any]]]:
-    try:
-        thread = AsyncThread()
-        thread.start()
-        return thread.run_task(async_fetch_ticker_news(symbol))
-    finally:
-        thread.stop()
+    return run_task(async_fetch_ticker_news(symbol))
 
 async def async_fetch_ticker_news(symbol: str) -> Optional[List[Dict[str, Any]]]:
-    context = None
-    async with aiohttp.ClientSession() as session:
-        for context in rate_limiter.try_request(
-            constants.FINVIZ_FETCH_RETRY_LIMIT
-        ):
-            with context:
-                async with session.get(
-                    _stock_url, headers = _headers, params = {'t': symbol}
-                ) as response:
-                    if response.status == 200:
-                        page = html.fromstring(await response.text())
-                        news = page.cssselect('a[class="tab-link-news"]')
-                        dates = []
-                        for i, _ in enumerate(news):
-                            tr = news[i].getparent().getparent().getparent().getparent()
-                            date_str = tr[0].text.strip()
-                            if ' ' not in date_str:
-                                tbody = tr.getparent()
-                                previous_date_str = ''
-                                j = 1
-                                while ' ' not in previous_date_str:
-                                    try:
-                                        previous_date_str = tbody[i-j][0].text.strip()
-                                    except IndexError:
-                                        break
-                                    j += 1
-                                date_str = ' '.join([previous_date_str.split(' ')[0], date_str])
-                            dates.append(
-                                datetime.datetime.strptime(date_str, "%b-%d-%y %I:%M%p")
-                            )
-                        headlines = [row.xpath('text()')[0] for row in news]
-                        urls = [row.get('href') for row in news]
-                        items = []
-                        for date, headline, url in list(zip(dates, headlines, urls)):
-                            items.append(dict(
-                                date = str(date),
-                                headline = headline,
-                                url = url
-                            ))
-                        return items
-                    if response.status == 404:
-                        return None
-                    raise RuntimeError('Server response code {0}'.format(response.status))
-        logger.error('error fetching ticker news for %s: %s', symbol, str(context.errors[-1]))
-        return None
+    return (await async_fetch_ticker_page(symbol))['news']
@@ -0,0 +1,230 @@
+import functools
+import logging
+import time
+import typing
+import urllib.parse
+
+from typing import (
+    Any, Mapping, Optional
+)
+
+import aiohttp
+import multidict
+
+from parkit import (
+    create_string_digest,
+    Dict,
+    File,
+    ObjectNotFoundError,
+    transaction
+)
+
+import underdog.constants as constants
+
+logger = logging.getLogger(__name__)
+
+_ignored_params = {'apiKey'}
+
+_validators = {'etag': 'If-None-Match', 'last-modified': 'If-Modified-Since'}
+
+class CachedResponse():
+
+    def __init__(
+        self,
+        status: int,
+        headers: Mapping[str, str],
+        body: bytes,
+        cached: bool
+    ):
+        self._status = status
+        self._headers = multidict.CIMultiDict(headers)
+        self._body = body
+        self._cached = cached
+
+    @property
+    def status(self) -> int:
+        return self._status
+
+    @property
+    def headers(self) -> multidict.CIMultiDict:
+        return self._headers
+
+    @property
+    def body(self) -> bytes:
+        return self._body
+
+    @property
+    def text(self) -> str:
+        return self._body.decode('utf-8', errors = 'replace')
+
+    @property
+    def cached(self) -> bool:
+        return self._cached
+
+class ResponseCache():
+
+    def __init__(
+        self,
+        path: str = 'httpcache',
+        /, *,
+        maxsize: int = constants.HTTP_CACHE_MAX_BYTES,
+        site_uuid: Optional[str] = None
+    ):
+        self._path = path
+        self._maxsize = maxsize
+        self._site_uuid = site_uuid
+        self._entries = Dict(
+            '{0}/entries'.format(path),
+            create = True, bind = True, site_uuid = site_uuid
+        )
+        self._stats = Dict(
+            '{0}/stats'.format(path),
+            create = True, bind = True, site_uuid = site_uuid
+        )
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @property
+    def stats(self) -> typing.Dict[str, int]:
+        return {
+            name: self._stats.get(name, 0)
+            for name in ['hits', 'misses', 'revalidated', 'evictions', 'bytes']
+        }
+
+    @staticmethod
+    def key(url: str, params: Optional[Mapping[str, Any]] = None) -> str:
+        query = sorted(
+            (str(name), str(value)) for name, value in (params or {}).items()
+            if name not in _ignored_params
+        )
+        return create_string_digest(
+            '?'.join([url, urllib.parse.urlencode(query)])
+        )
+
+    def _body(self, key: str) -> File:
+        return File(
+            '{0}/bodies/{1}'.format(self._path, key),
+            create = True, bind = True, site_uuid = self._site_uuid
+        )
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with transaction(self._stats):
+            self._stats[name] = self._stats.get(name, 0) + value
+
+    def _touch(self, key: str, entry: typing.Dict[str, Any], **kwargs) -> None:
+        with transaction(self._entries):
+            self._entries[key] = {**entry, **kwargs, 'accessed': time.time()}
+
+    def _load(self, key: str, entry: typing.Dict[str, Any]) -> Optional[CachedResponse]:
+        try:
+            body = File(
+                '{0}/bodies/{1}'.format(self._path, key),
+                create = False, bind = True, site_uuid = self._site_uuid
+            ).get_content()
+        except ObjectNotFoundError:
+            self.invalidate_key(key)
+            return None
+        if body is None:
+            self.invalidate_key(key)
+            return None
+        return CachedResponse(entry['status'], entry['headers'], bytes(body), True)
+
+    def lookup(
+        self,
+        url: str,
+        params: Optional[Mapping[str, Any]] = None
+    ) -> Optional[CachedResponse]:
+        key = self.key(url, params)
+        entry = self._entries.get(key)
+        if entry is None or entry['expires'] < time.time():
+            return None
+        response = self._load(key, entry)
+        if response is not None:
+            self._touch(key, entry)
+            self._count('hits')
+        return response
+
+    async def fetch(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        /, *,
+        ttl: float,
+        params: Optional[Mapping[str, Any]] = None,
+        headers: Optional[Mapping[str, str]] = None
+    ) -> CachedResponse:
+        key = self.key(url, params)
+        entry = self._entries.get(key)
+        request_headers = dict(headers or {})
+        if entry is not None:
+            for name, header in _validators.items():
+                if name in entry['headers']:
+                    request_headers[header] = entry['headers'][name]
+        async with session.get(url, params = params, headers = request_headers) as response:
+            if response.status == 304 and entry is not None:
+                cached = self._load(key, entry)
+                if cached is not None:
+                    self._touch(key, entry, expires = time.time() + ttl)
+                    self._count('revalidated')
+                    return cached
+            body = await response.read()
+            result = CachedResponse(response.status, response.headers, body, False)
+        self._count('misses')
+        if result.status == 200:
+            self.store(key, result, ttl)
+        return result
+
+    def store(self, key: str, response: CachedResponse, ttl: float) -> None:
+        validators = {
+            name: response.headers[name] for name in _validators
+            if name in response.headers
+        }
+        with transaction(self._entries):
+            previous = self._entries.get(key)
+            self._body(key).set_content(response.body)
+            self._entries[key] = dict(
+                status = response.status,
+                headers = validators,
+                size = len(response.body),
+                expires = time.time() + ttl,
+                accessed = time.time()
+            )
+        self._count('bytes', len(response.body) - (0 if previous is None else previous['size']))
+        if self._stats.get('bytes', 0) > self._maxsize:
+            self.evict()
+
+    def invalidate(self, url: str, params: Optional[Mapping[str, Any]] = None) -> None:
+        self.invalidate_key(self.key(url, params))
+
+    def invalidate_key(self, key: str) -> None:
+        with transaction(self._entries):
+            entry = self._entries.pop(key, None)
+            try:
+                File(
+                    '{0}/bodies/{1}'.format(self._path, key),
+                    create = False, bind = True, site_uuid = self._site_uuid
+                ).drop()
+            except ObjectNotFoundError:
+                pass
+        if entry is not None:
+            self._count('bytes', -entry['size'])
+
+    def evict(self) -> None:
+        total = self._stats.get('bytes', 0)
+        if total <= self._maxsize:
+            return
+        for key, entry in sorted(
+            self._entries.items(), key = lambda item: item[1]['accessed']
+        ):
+            self.invalidate_key(key)
+            self._count('evictions')
+            total -= entry['size']
+            if total <= self._maxsize:
+                break
+        logger.info('http cache evicted to %i bytes', total)
+
+@functools.lru_cache(None)
+def response_cache() -> ResponseCache:
+    return ResponseCache()
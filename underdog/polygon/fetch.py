@@ -1,10 +1,11 @@
+import asyncio
 import datetime
 import json
 import logging
 import time
 
 from typing import (
-    Dict, List, Optional, Union
+    Any, Dict, Iterable, List, Optional, Union
 )
 
 import aiohttp
@@ -13,12 +14,38 @@ import pandas as pd
 
 from parkit import getenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 import underdog.constants as constants
 
-from underdog.asyncthread import AsyncThread
-from underdog.ratelimiter import RateLimiter
+from underdog.analysis.accessor import (
+    MARKET_CLOSE,
+    MARKET_DATE,
+    MARKET_HIGH,
+    MARKET_LOW,
+    MARKET_OPEN,
+    MARKET_SYMBOL,
+    MARKET_TWAP,
+    MARKET_VOLUME,
+    MARKET_VWAP
+)
+from underdog.eventloop import (
+    client_session,
+    run_task
+)
+from underdog.httpcache import response_cache
+from underdog.ratelimiter import (
+    parse_retry_after,
+    RateLimiter,
+    RateLimitExceeded
+)
 from underdog.utility import (
-    encode_symbol,
+    as_pandas,
+    encodable_symbols,
+    encode_symbols,
     nth_previous_trading_date,
     trading_daterange,
     twap
@@ -26,137 +53,178 @@ from underdog.utility import (
 
 logger = logging.getLogger(__name__)
 
+_api_url = 'https://api.polygon.io'
+
 rate_limiter = RateLimiter(
     'polygon_rate_limiter',
     constants.POLYGON_REQUEST_INTERVAL,
-    constants.POLYGON_MAX_REQUESTS_PER_INTERVAL
+    constants.POLYGON_MAX_REQUESTS_PER_INTERVAL,
+    adaptive = constants.POLYGON_ADAPTIVE_RATE_LIMIT,
+    ceiling = constants.POLYGON_MAX_REQUESTS_CEILING
 )
 
-def build_dataframe(
-    rows: List[Dict[str, Union[str, float, int, pd.Timestamp]]]
-) -> Optional[pd.DataFrame]:
+_market_fields = ['v', 'vw', 'o', 'c', 'h', 'l']
+
+def _loads(body: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def decode_grouped_daily(
+    rows: List[Dict[str, Any]],
+    date: float
+) -> Optional[np.ndarray]:
 
-    if len(rows) == 0:
+    size = len(rows)
+    if size == 0:
         return None
 
-    df = pd.DataFrame(rows)
-
-    df = df.rename(
-        columns = {
-            'o':'open',
-            'c':'close',
-            'h':'high',
-            'l':'low',
-            'vw':'vwap',
-            'v':'volume',
-            'T':'symbol'
-        }
+    array = np.empty((size, 9), dtype = np.float64)
+    for column, field in enumerate(_market_fields, MARKET_VOLUME):
+        array[:, column] = np.fromiter(
+            (
+                value if value is not None else np.nan
+                for value in (row.get(field) for row in rows)
+            ),
+            dtype = np.float64, count = size
+        )
+    symbols = np.array([row.get('T') for row in rows], dtype = object)
+
+    mask = np.fromiter(
+        (isinstance(symbol, str) for symbol in symbols),
+        dtype = np.bool_, count = size
     )
+    mask[mask] = encodable_symbols(symbols[mask])
+    mask &= np.isfinite(array[:, MARKET_VOLUME:MARKET_DATE]).all(axis = 1)
+    mask &= array[:, MARKET_VOLUME] >= 0
+    mask &= (array[:, MARKET_VWAP:MARKET_DATE] > 0).all(axis = 1)
 
-    if 'n' in df.columns.to_list():
-        df = df.drop('n', axis = 1)
-    if 't' in df.columns.to_list():
-        df = df.drop('t', axis = 1)
-
-    df = df.astype({
-        'volume': np.float64,
-        'open': np.float64,
-        'close': np.float64,
-        'high': np.float64,
-        'low': np.float64,
-        'vwap': np.float64
-    })
-
-    df = df[
-        (df['volume'] >= 0) & \
-        (df['open'] > 0) & \
-        (df['close'] > 0) & \
-        (df['high'] > 0) & \
-        (df['low'] > 0) & \
-        (df['vwap'] > 0)
-    ]
-
-    with pd.option_context('mode.use_inf_as_null', True):
-        df = df.dropna()
-
-    if len(df) == 0:
+    array = array[mask]
+    if len(array) == 0:
         return None
 
-    df['symbol'] = df['symbol'].apply(encode_symbol)
-    df = twap(df)
+    array[:, MARKET_SYMBOL] = encode_symbols(symbols[mask])
+    array[:, MARKET_DATE] = date
+    columns = dict(
+        open = array[:, MARKET_OPEN],
+        high = array[:, MARKET_HIGH],
+        low = array[:, MARKET_LOW],
+        close = array[:, MARKET_CLOSE]
+    )
+    array[:, MARKET_TWAP] = twap(columns)['twap']
 
-    return df.reset_index(drop = True)
+    return array[np.argsort(array[:, MARKET_SYMBOL], kind = 'stable')]
+
+def parse_grouped_daily(
+    date: datetime.date,
+    body: Union[bytes, str]
+) -> Optional[np.ndarray]:
+    result = _loads(body)
+    if result['status'] == 'OK':
+        if result['resultsCount'] > 0:
+            return decode_grouped_daily(
+                result['results'],
+                np.float64(time.mktime(date.timetuple()))
+            )
+        raise RuntimeError('no results returned for {0}'.format(date))
+    raise RuntimeError('response status is {0}'.format(result['status']))
 
 async def async_fetch_grouped_daily(
     session: aiohttp.ClientSession,
     date: datetime.date,
     api_key: str,
     max_attempts: int = constants.POLYGON_FETCH_RETRY_LIMIT
-) -> Optional[pd.DataFrame]:
+) -> Optional[np.ndarray]:
+    url = '{0}/v2/aggs/grouped/locale/us/market/stocks/{1}'.format(
+        _api_url, date.strftime('%Y-%m-%d')
+    )
+    params = {'apiKey': api_key}
+    cached = response_cache().lookup(url, params)
+    if cached is not None:
+        try:
+            return parse_grouped_daily(date, cached.body)
+        except (KeyError, RuntimeError, ValueError):
+            response_cache().invalidate(url, params)
     logger.info('fetch grouped daily %s', str(date))
     context = None
-    for context in rate_limiter.try_request(max_attempts):
-        with context:
-            async with session.get(
-                'https://api.polygon.io/v2/aggs/grouped/locale/us/market/stocks/{0}'.format(
-                    date.strftime('%Y-%m-%d')
-                ),
-                params = {'apiKey': api_key}
-            ) as response:
-                if response.status == 200:
-                    result = json.loads(await response.text())
-                    if result['status'] == 'OK':
-                        if result['resultsCount'] > 0:
-                            df = build_dataframe([
-                                {**row, **{'date': np.float64(time.mktime(date.timetuple()))}}
-                                for row in result['results']
-                            ])
-                            if context.attempts > 1:
-                                logger.warning(
-                                    '%i attempts fetching market data for %s',
-                                    context.attempts, str(date)
-                                )
-                            return df
-                        raise RuntimeError('no results returned for {0}'.format(date))
-                    raise RuntimeError('response status is {0}'.format(result['status']))
-                raise RuntimeError('server response code {0}'.format(response.status))
+    async for context in rate_limiter.try_request_async(max_attempts):
+        async with context:
+            response = await response_cache().fetch(
+                session, url,
+                params = params,
+                ttl = constants.POLYGON_MARKET_CACHE_TTL
+            )
+            if response.status == 200:
+                array = parse_grouped_daily(date, response.body)
+                if context.attempts > 1:
+                    logger.warning(
+                        '%i attempts fetching market data for %s',
+                        context.attempts, str(date)
+                    )
+                return array
+            if response.status == 429:
+                raise RateLimitExceeded(
+                    'server response code {0}'.format(response.status),
+                    parse_retry_after(response.headers.get('Retry-After'))
+                )
+            raise RuntimeError('server response code {0}'.format(response.status))
     logger.error('error fetching market data for %s: %s', str(date), str(context.errors[-1]))
     return None
 
+def market_window() -> List[datetime.date]:
+    return list(trading_daterange(
+        nth_previous_trading_date(504),
+        nth_previous_trading_date(1)
+    ))
+
+async def async_fetch_market_dates(
+    api_key: str,
+    dates: Iterable[datetime.date]
+) -> Dict[datetime.date, np.ndarray]:
+    session = client_session(_api_url)
+    dates = list(dates)
+    semaphore = asyncio.Semaphore(constants.POLYGON_FETCH_CONCURRENCY)
+
+    async def fetch(date: datetime.date) -> Optional[np.ndarray]:
+        async with semaphore:
+            return await async_fetch_grouped_daily(session, date, api_key)
+
+    return {
+        date: array for date, array in zip(
+            dates, await asyncio.gather(*[fetch(date) for date in dates])
+        )
+        if array is not None
+    }
+
 async def async_fetch_market(
     api_key: str,
     agg_df: Optional[pd.DataFrame]
 ) -> Optional[pd.DataFrame]:
-    async with aiohttp.ClientSession() as session:
-        dates = list(trading_daterange(
-            nth_previous_trading_date(504),
-            nth_previous_trading_date(1)
-        ))
-        for date in [time.mktime(date.timetuple()) for date in dates]:
-            if agg_df is None or len(agg_df[agg_df['date'] == date]) == 0:
-                df = await async_fetch_grouped_daily(
-                    session,
-                    datetime.datetime.fromtimestamp(date).date(),
-                    api_key
-                )
-                if df is not None:
-                    if agg_df is None:
-                        agg_df = df
-                    else:
-                        agg_df = pd.concat([agg_df, df], ignore_index = True)
-    if agg_df is not None and len(agg_df) > 0:
-        return agg_df.sort_values(['date', 'symbol']).reset_index(drop = True)
+    cached_dates = set() if agg_df is None else set(pd.unique(agg_df['date']))
+    arrays = list((await async_fetch_market_dates(
+        api_key,
+        [
+            date for date in market_window()
+            if time.mktime(date.timetuple()) not in cached_dates
+        ]
+    )).values())
+    dfs = [] if len(arrays) == 0 else [as_pandas(np.concatenate(arrays))]
+    if agg_df is not None:
+        dfs.insert(0, agg_df)
+    if len(dfs) > 0:
+        agg_df = pd.concat(dfs, ignore_index = True)
+        if len(agg_df) > 0:
+            return agg_df.sort_values(['date', 'symbol']).reset_index(drop = True)
     return None
 
+def fetch_market_dates(
+    dates: Iterable[datetime.date]
+) -> Dict[datetime.date, np.ndarray]:
+    api_key = getenv(constants.POLYGON_API_KEY_ENVNAME)
+    return run_task(async_fetch_market_dates(api_key, dates))
+
 def fetch_market(
     df: Optional[pd.DataFrame]
 ) -> Optional[pd.DataFrame]:
-    thread = None
-    try:
-        thread = AsyncThread()
-        thread.start()
-        api_key = getenv(constants.POLYGON_API_KEY_ENVNAME)
-        return thread.run_task(async_fetch_market(api_key, df))
-    finally:
-        if thread:
-            thread.stop()
+    api_key = getenv(constants.POLYGON_API_KEY_ENVNAME)
+    return run_task(async_fetch_market(api_key, df))
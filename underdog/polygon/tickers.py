@@ -1,33 +1,68 @@
+import datetime
 import json
 import logging
+import typing
 
 from typing import (
-    Dict,
+    Any,
+    Iterable,
     List,
     Optional,
+    Set,
+    Tuple,
     Union
 )
 
-import aiohttp
 import pandas as pd
 
-from parkit import getenv
+from parkit import (
+    Dict,
+    getenv,
+    transaction
+)
 
 import underdog.constants as constants
 
-from underdog.asyncthread import AsyncThread
-from underdog.ratelimiter import RateLimiter
+from underdog.eventloop import (
+    client_session,
+    run_task
+)
+from underdog.httpcache import response_cache
+from underdog.ratelimiter import (
+    parse_retry_after,
+    RateLimiter,
+    RateLimitExceeded
+)
 
 logger = logging.getLogger(__name__)
 
+_tickers_url = 'https://api.polygon.io/v3/reference/tickers'
+
+TICKERS_PATH: str = 'reference/tickers'
+
+EXCHANGES_PATH: str = 'reference/exchanges'
+
+SYNC_PATH: str = 'reference/sync'
+
 rate_limiter = RateLimiter(
     'polygon_rate_limiter',
     constants.POLYGON_REQUEST_INTERVAL,
-    constants.POLYGON_MAX_REQUESTS_PER_INTERVAL
+    constants.POLYGON_MAX_REQUESTS_PER_INTERVAL,
+    adaptive = constants.POLYGON_ADAPTIVE_RATE_LIMIT,
+    ceiling = constants.POLYGON_MAX_REQUESTS_CEILING
 )
 
+def _tickers(site_uuid: Optional[str] = None) -> Dict:
+    return Dict(TICKERS_PATH, create = True, bind = True, site_uuid = site_uuid)
+
+def _exchanges(site_uuid: Optional[str] = None) -> Dict:
+    return Dict(EXCHANGES_PATH, create = True, bind = True, site_uuid = site_uuid)
+
+def _sync_state(site_uuid: Optional[str] = None) -> Dict:
+    return Dict(SYNC_PATH, create = True, bind = True, site_uuid = site_uuid)
+
 def build_dataframe(
-    rows: List[Dict[str, Union[str, float, int, bool]]]
+    rows: List[typing.Dict[str, Union[str, float, int, bool]]]
 ) -> Optional[pd.DataFrame]:
 
     if len(rows) == 0:
@@ -36,54 +71,158 @@ def build_dataframe(
     df = pd.DataFrame(rows)
 
     df = df.rename(dict(ticker = 'symbol', primary_exchange = 'exchange'), axis = 1)
-    df['last_updated_utc'] = df['last_updated_utc'].apply(pd.Timestamp)
+    df['last_updated_utc'] = pd.to_datetime(df['last_updated_utc'], utc = True)
 
     return df.sort_values('symbol').reset_index(drop = True)
 
-async def async_fetch_tickers(
+def _move_symbols(
+    exchanges: Dict,
+    moves: Iterable[Tuple[str, Optional[str], Optional[str]]]
+):
+    removed: typing.Dict[str, Set[str]] = {}
+    added: typing.Dict[str, Set[str]] = {}
+    for symbol, previous, current in moves:
+        if previous == current:
+            continue
+        if previous is not None:
+            removed.setdefault(previous, set()).add(symbol)
+        if current is not None:
+            added.setdefault(current, set()).add(symbol)
+    for exchange in set(removed).union(added):
+        symbols = set(exchanges[exchange]) if exchange in exchanges else set()
+        symbols = symbols.difference(removed.get(exchange, set())).union(added.get(exchange, set()))
+        if symbols:
+            exchanges[exchange] = sorted(symbols)
+        elif exchange in exchanges:
+            del exchanges[exchange]
+
+def upsert_tickers(
+    rows: Iterable[typing.Dict[str, Any]],
+    site_uuid: Optional[str] = None
+) -> int:
+    tickers = _tickers(site_uuid)
+    exchanges = _exchanges(site_uuid)
+    moves = []
+    with transaction(tickers):
+        for row in rows:
+            symbol = row['ticker']
+            previous = tickers[symbol] if symbol in tickers else None
+            if previous is not None and \
+            previous.get('last_updated_utc') == row.get('last_updated_utc'):
+                continue
+            tickers[symbol] = row
+            moves.append((
+                symbol,
+                None if previous is None else previous.get('primary_exchange'),
+                row.get('primary_exchange')
+            ))
+        _move_symbols(exchanges, moves)
+    return len(moves)
+
+def remove_tickers(
+    symbols: Iterable[str],
+    site_uuid: Optional[str] = None
+):
+    tickers = _tickers(site_uuid)
+    exchanges = _exchanges(site_uuid)
+    with transaction(tickers):
+        _move_symbols(exchanges, [
+            (symbol, tickers.pop(symbol).get('primary_exchange'), None)
+            for symbol in symbols if symbol in tickers
+        ])
+
+async def async_fetch_ticker_page(
+    url: str,
     api_key: str,
     max_attempts: int = constants.POLYGON_FETCH_RETRY_LIMIT
-) -> Optional[pd.DataFrame]:
-    results = []
-    next_url = 'https://api.polygon.io/v3/reference/tickers'
-    async with aiohttp.ClientSession() as session:
-        while True:
-            for context in rate_limiter.try_request(max_attempts):
-                with context:
-                    async with session.get(
-                        next_url,
-                        params = {
-                            'market': 'stocks',
-                            'limit': '1000',
-                            'apiKey': api_key
-                        }
-                    ) as response:
-                        if response.status == 200:
-                            result = json.loads(await response.text())
-                            next_url = result['next_url'] if 'next_url' in result else None
-                            if result['status'] == 'OK':
-                                results.extend(result['results'])
-                                if next_url is None:
-                                    if context.attempts > 1:
-                                        logger.warning(
-                                            '%i attempts fetching ticker data',
-                                            context.attempts
-                                        )
-                                    return build_dataframe(results)
-                            else:
-                                raise RuntimeError('response status is {0}'.format(result['status']))
-                        else:
-                            raise RuntimeError('server response code {0}'.format(response.status))
-    logger.error('error fetching ticker data')
+) -> Optional[typing.Dict[str, Any]]:
+    params = {
+        'market': 'stocks',
+        'limit': '1000',
+        'apiKey': api_key
+    }
+    cached = response_cache().lookup(url, params)
+    if cached is not None:
+        result = json.loads(cached.text)
+        if result.get('status') == 'OK':
+            return result
+        response_cache().invalidate(url, params)
+    session = client_session(url)
+    context = None
+    async for context in rate_limiter.try_request_async(max_attempts):
+        async with context:
+            response = await response_cache().fetch(
+                session, url,
+                params = params,
+                ttl = constants.POLYGON_TICKERS_CACHE_TTL
+            )
+            if response.status == 200:
+                result = json.loads(response.text)
+                if result['status'] != 'OK':
+                    raise RuntimeError('response status is {0}'.format(result['status']))
+                if context.attempts > 1:
+                    logger.warning('%i attempts fetching ticker data', context.attempts)
+                return result
+            if response.status == 429:
+                raise RateLimitExceeded(
+                    'server response code {0}'.format(response.status),
+                    parse_retry_after(response.headers.get('Retry-After'))
+                )
+            raise RuntimeError('server response code {0}'.format(response.status))
+    logger.error(
+        'error fetching ticker data: %s',
+        str(context.errors[-1]) if context is not None else None
+    )
     return None
 
-def fetch_tickers() -> Optional[pd.DataFrame]:
-    thread = None
-    try:
-        thread = AsyncThread()
-        thread.start()
-        api_key = getenv(constants.POLYGON_API_KEY_ENVNAME)
-        return thread.run_task(async_fetch_tickers(api_key))
-    finally:
-        if thread:
-            thread.stop()
+async def async_sync_tickers(
+    api_key: str,
+    site_uuid: Optional[str] = None
+) -> bool:
+    state = _sync_state(site_uuid)
+    resumed = state.get('next_url') is not None
+    next_url = state['next_url'] if resumed else _tickers_url
+    seen: Set[str] = set()
+    changed = 0
+    if resumed:
+        logger.info('resuming ticker sync')
+    while next_url is not None:
+        result = await async_fetch_ticker_page(next_url, api_key)
+        if result is None:
+            if resumed and next_url == state['next_url'] and len(seen) == 0:
+                state['next_url'] = None
+            return False
+        rows = result['results'] if 'results' in result else []
+        changed += upsert_tickers(rows, site_uuid)
+        seen.update(row['ticker'] for row in rows)
+        next_url = result['next_url'] if 'next_url' in result else None
+        state['next_url'] = next_url
+    if not resumed:
+        remove_tickers(set(_tickers(site_uuid).keys()).difference(seen), site_uuid)
+    state['completed'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    logger.info('ticker sync complete, %i tickers changed', changed)
+    return True
+
+def sync_tickers(site_uuid: Optional[str] = None) -> bool:
+    api_key = getenv(constants.POLYGON_API_KEY_ENVNAME)
+    return run_task(async_sync_tickers(api_key, site_uuid))
+
+def lookup_ticker(
+    symbol: str,
+    /, *,
+    site_uuid: Optional[str] = None
+) -> Optional[typing.Dict[str, Any]]:
+    tickers = _tickers(site_uuid)
+    return tickers[symbol] if symbol in tickers else None
+
+def lookup_exchange(
+    exchange: str,
+    /, *,
+    site_uuid: Optional[str] = None
+) -> List[str]:
+    exchanges = _exchanges(site_uuid)
+    return list(exchanges[exchange]) if exchange in exchanges else []
+
+def fetch_tickers(site_uuid: Optional[str] = None) -> Optional[pd.DataFrame]:
+    sync_tickers(site_uuid)
+    return build_dataframe(list(_tickers(site_uuid).values()))
@@ -1,73 +1,161 @@
+import asyncio
+import collections
+import datetime
+import email.utils
 import logging
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
 import time
-import uuid
+import typing
 
 from typing import (
-    Any, Iterator, List, Optional
+    Any, AsyncIterator, Iterator, List, Optional, Tuple
 )
 
 import parkit.constants
 
 from parkit import (
-    Array,
     create_string_digest,
-    Dict,
-    get_site_uuid,
-    getenv,
-    import_site,
-    transaction
+    getenv
 )
 
+import underdog.constants as constants
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
 logger = logging.getLogger(__name__)
 
-import_site(
-    getenv(parkit.constants.GLOBAL_SITE_STORAGE_PATH_ENVNAME, str),
-    create = True
-)
+EntryId = Tuple[int, int]
 
-class RateLimiter():
+class RateLimitExceeded(RuntimeError):
 
-    def __init__(
-        self,
-        name: str,
-        interval: float,
-        maxsize: int
-    ):
-        self._name = name
-        paths = {}
-        for obj_type in ['entry', 'exit']:
-            paths[obj_type] = '/'.join([
-                'memory/underdog',
-                '-'.join([
-                    'rate-limiter',
-                    create_string_digest(
-                        ''.join([
-                            name,
-                            str(interval),
-                            str(maxsize),
-                            obj_type
-                        ])
-                    )
-                ])
-            ])
-        self._entry = Array(
-            paths['entry'],
-            maxsize = maxsize,
-            create = True, bind = True,
-            site_uuid = get_site_uuid(
-                getenv(parkit.constants.GLOBAL_SITE_STORAGE_PATH_ENVNAME, str)
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(0., float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo = datetime.timezone.utc)
+    return max(0., (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+class SlidingWindow():
+
+    _header = struct.Struct('qqdq')
+    _slot = struct.Struct('q')
+
+    def __init__(self, path: str, maxsize: int, ceiling: int):
+        self._ceiling = ceiling
+        self._lock = threading.Lock()
+        self._size = self._header.size + self._slot.size * ceiling
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self:
+            if os.fstat(self._fd).st_size < self._size:
+                os.ftruncate(self._fd, self._size)
+        self._mmap = mmap.mmap(self._fd, self._size)
+        with self:
+            head, size, limit, _ = self._header.unpack_from(self._mmap, 0)
+            if size != ceiling or head >= ceiling or not 1. <= limit <= ceiling:
+                self._mmap[:] = bytes(self._size)
+                self._header.pack_into(self._mmap, 0, 0, ceiling, float(maxsize), 0)
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if sys.platform == 'win32':
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                while True:
+                    try:
+                        msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                        return
+                    except OSError:
+                        pass
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def __exit__(self, error_type: type, error: Optional[Any], traceback: Any):
+        try:
+            if sys.platform == 'win32':
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+    def _offset(self, slot: int) -> int:
+        return self._header.size + self._slot.size * slot
+
+    @property
+    def limit(self) -> float:
+        with self:
+            return self._header.unpack_from(self._mmap, 0)[2]
+
+    def try_acquire(self, interval_ns: int) -> Tuple[Optional[EntryId], float]:
+        with self:
+            head, ceiling, limit, blocked_ns = self._header.unpack_from(self._mmap, 0)
+            now_ns = time.time_ns()
+            if now_ns < blocked_ns:
+                return (None, (blocked_ns - now_ns) / 1e9)
+            (oldest_ns,) = self._slot.unpack_from(
+                self._mmap, self._offset((head - int(limit)) % ceiling)
             )
-        )
-        self._exit = Dict(
-            paths['exit'],
-            create = True, bind = True,
-            site_uuid = get_site_uuid(
-                getenv(parkit.constants.GLOBAL_SITE_STORAGE_PATH_ENVNAME, str)
+            if oldest_ns == 0 or now_ns - oldest_ns > interval_ns:
+                self._slot.pack_into(self._mmap, self._offset(head), now_ns)
+                self._header.pack_into(
+                    self._mmap, 0, (head + 1) % ceiling, ceiling, limit, blocked_ns
+                )
+                return ((head, now_ns), 0.)
+        return (None, (oldest_ns + interval_ns - now_ns) / 1e9)
+
+    def release(self, entry_id: EntryId) -> None:
+        slot, entry_ns = entry_id
+        with self:
+            (slot_ns,) = self._slot.unpack_from(self._mmap, self._offset(slot))
+            if slot_ns == entry_ns:
+                self._slot.pack_into(self._mmap, self._offset(slot), time.time_ns())
+
+    def increase(self) -> None:
+        with self:
+            head, ceiling, limit, blocked_ns = self._header.unpack_from(self._mmap, 0)
+            self._header.pack_into(
+                self._mmap, 0, head, ceiling, min(float(ceiling), limit + 1. / limit), blocked_ns
             )
-        )
-        self._maxsize = maxsize
-        self._interval_ns = interval * 1e9
-        self._entry_id = None
+
+    def throttle(self, blocked_ns: int, decrease: bool) -> None:
+        with self:
+            head, ceiling, limit, blocked_until_ns = self._header.unpack_from(self._mmap, 0)
+            self._header.pack_into(
+                self._mmap, 0, head, ceiling,
+                max(1., limit / 2.) if decrease else limit,
+                max(blocked_ns, blocked_until_ns)
+            )
+
+class RateLimiterContext():
+
+    def __init__(self, limiter: 'RateLimiter'):
+        self._limiter = limiter
+        self._entry_id: Optional[EntryId] = None
         self._errors: List[Any] = []
         self._failed = False
         self._attempts = 0
@@ -76,18 +164,6 @@ class RateLimiter():
     def attempts(self) -> int:
         return self._attempts
 
-    @property
-    def name(self) -> str:
-        return self._name
-
-    @property
-    def maxsize(self) -> int:
-        return self._maxsize
-
-    @property
-    def interval(self) -> float:
-        return self._interval_ns / 1e9
-
     @property
     def errors(self) -> List[Any]:
         return self._errors
@@ -99,46 +175,215 @@ class RateLimiter():
     def try_request(
         self,
         max_attempts: int = 1
-    ) -> Iterator[Any]:
-        if self._entry_id is not None:
-            raise RecursionError()
-        self._errors = []
-        self._failed = False
-        self._attempts = 0
+    ) -> Iterator['RateLimiterContext']:
+        for i in range(max_attempts):
+            if i > 0:
+                time.sleep(self._limiter.backoff(i, self._errors[-1]))
+            self._attempts += 1
+            yield self
+        self._failed = True
+
+    async def try_request_async(
+        self,
+        max_attempts: int = 1
+    ) -> AsyncIterator['RateLimiterContext']:
         for i in range(max_attempts):
             if i > 0:
-                time.sleep(i * i)
+                await asyncio.sleep(self._limiter.backoff(i, self._errors[-1]))
             self._attempts += 1
             yield self
         self._failed = True
 
     def __enter__(self):
-        while True:
-            with transaction(self._entry):
-                if len(self._entry) < self._maxsize:
-                    entry_id = str(uuid.uuid4())
-                    self._entry.append((time.time_ns(), entry_id))
-                    self._entry_id = entry_id
-                    return
-                entry_ns, entry_id = self._entry[0]
-                if entry_id in self._exit:
-                    oldest_ns = self._exit.pop(entry_id)
-                else:
-                    oldest_ns = entry_ns
-                now_ns = time.time_ns()
-                if now_ns - oldest_ns > self._interval_ns:
-                    entry_id = str(uuid.uuid4())
-                    self._entry.append((time.time_ns(), entry_id))
-                    self._entry_id = entry_id
-                    return
-            time.sleep((oldest_ns + self._interval_ns - now_ns) / 1e9)
+        if self._entry_id is not None:
+            raise RecursionError()
+        self._entry_id = self._limiter.acquire()
 
     def __exit__(self, error_type: type, error: Optional[Any], traceback: Any):
         try:
             assert self._entry_id is not None
-            self._exit[self._entry_id] = time.time_ns()
-            return True
+            self._limiter.release(self._entry_id, error)
+            return error is None or isinstance(error, Exception)
         finally:
             self._entry_id = None
             if error is not None:
                 self._errors.append(error)
+
+    async def __aenter__(self):
+        if self._entry_id is not None:
+            raise RecursionError()
+        self._entry_id = await self._limiter.acquire_async()
+
+    async def __aexit__(self, error_type: type, error: Optional[Any], traceback: Any):
+        try:
+            assert self._entry_id is not None
+            self._limiter.release(self._entry_id, error)
+            return error is None or isinstance(error, Exception)
+        finally:
+            self._entry_id = None
+            if error is not None:
+                self._errors.append(error)
+
+class RateLimiter():
+
+    def __init__(
+        self,
+        name: str,
+        interval: float,
+        maxsize: int,
+        /, *,
+        adaptive: bool = False,
+        ceiling: Optional[int] = None
+    ):
+        if ceiling is None or not adaptive:
+            ceiling = maxsize
+        if ceiling < maxsize:
+            raise ValueError()
+        self._name = name
+        self._path = os.path.join(
+            tempfile.gettempdir(),
+            '-'.join([
+                'underdog-rate-limiter',
+                create_string_digest(
+                    ''.join([
+                        getenv(parkit.constants.GLOBAL_SITE_STORAGE_PATH_ENVNAME, str),
+                        name,
+                        str(interval),
+                        str(maxsize),
+                        str(ceiling)
+                    ])
+                )
+            ])
+        )
+        self._window: Optional[SlidingWindow] = None
+        self._window_lock = threading.Lock()
+        self._context: Optional[RateLimiterContext] = None
+        self._maxsize = maxsize
+        self._ceiling = ceiling
+        self._adaptive = adaptive
+        self._interval_ns = int(interval * 1e9)
+        self._contexts: typing.Dict[Any, List[RateLimiterContext]] = {}
+        self._errors: typing.Deque[Any] = collections.deque(
+            maxlen = constants.RATE_LIMITER_MAX_ERRORS
+        )
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @property
+    def ceiling(self) -> int:
+        return self._ceiling
+
+    @property
+    def adaptive(self) -> bool:
+        return self._adaptive
+
+    @property
+    def limit(self) -> float:
+        return self.window.limit
+
+    @property
+    def interval(self) -> float:
+        return self._interval_ns / 1e9
+
+    @property
+    def errors(self) -> List[Any]:
+        return list(self._errors)
+
+    @property
+    def attempts(self) -> int:
+        return 0 if self._context is None else self._context.attempts
+
+    @property
+    def failed(self) -> bool:
+        return False if self._context is None else self._context.failed
+
+    def try_request(
+        self,
+        max_attempts: int = 1
+    ) -> Iterator[RateLimiterContext]:
+        self._errors.clear()
+        self._context = RateLimiterContext(self)
+        return self._context.try_request(max_attempts)
+
+    def try_request_async(
+        self,
+        max_attempts: int = 1
+    ) -> AsyncIterator[RateLimiterContext]:
+        self._errors.clear()
+        self._context = RateLimiterContext(self)
+        return self._context.try_request_async(max_attempts)
+
+    @property
+    def window(self) -> SlidingWindow:
+        if self._window is None:
+            with self._window_lock:
+                if self._window is None:
+                    self._window = SlidingWindow(self._path, self._maxsize, self._ceiling)
+        return self._window
+
+    def _try_acquire(self) -> Tuple[Optional[EntryId], float]:
+        return self.window.try_acquire(self._interval_ns)
+
+    def acquire(self) -> EntryId:
+        while True:
+            entry_id, delay = self._try_acquire()
+            if entry_id is not None:
+                return entry_id
+            time.sleep(delay)
+
+    async def acquire_async(self) -> EntryId:
+        while True:
+            entry_id, delay = self._try_acquire()
+            if entry_id is not None:
+                return entry_id
+            await asyncio.sleep(delay)
+
+    def release(self, entry_id: EntryId, error: Optional[Any] = None) -> None:
+        self.window.release(entry_id)
+        if error is not None:
+            self._errors.append(error)
+        if isinstance(error, RateLimitExceeded):
+            retry_after = self.interval if error.retry_after is None else error.retry_after
+            logger.warning('%s throttled, retry after %.1fs', self._name, retry_after)
+            self.window.throttle(time.time_ns() + int(retry_after * 1e9), self._adaptive)
+        elif error is None and self._adaptive:
+            self.window.increase()
+
+    def backoff(self, attempt: int, error: Optional[Any]) -> float:
+        if isinstance(error, RateLimitExceeded):
+            return random.uniform(0., self.interval)
+        if self._adaptive:
+            return random.uniform(0., float(attempt))
+        return float(attempt * attempt)
+
+    def _push_context(self, key: Any) -> RateLimiterContext:
+        context = RateLimiterContext(self)
+        self._contexts.setdefault(key, []).append(context)
+        return context
+
+    def _pop_context(self, key: Any) -> RateLimiterContext:
+        contexts = self._contexts[key]
+        context = contexts.pop()
+        if len(contexts) == 0:
+            del self._contexts[key]
+        return context
+
+    def __enter__(self):
+        self._push_context(threading.get_ident()).__enter__()
+
+    def __exit__(self, error_type: type, error: Optional[Any], traceback: Any):
+        return self._pop_context(threading.get_ident()).__exit__(error_type, error, traceback)
+
+    async def __aenter__(self):
+        await self._push_context(asyncio.current_task()).__aenter__()
+
+    async def __aexit__(self, error_type: type, error: Optional[Any], traceback: Any):
+        return await self._pop_context(asyncio.current_task()).__aexit__(
+            error_type, error, traceback
+        )
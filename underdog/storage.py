@@ -0,0 +1,731 @@
+import datetime
+import logging
+import pickle
+import time
+import typing
+
+from typing import (
+    Any, Iterable, List, Optional, Set, Tuple, Union
+)
+
+import numpy as np
+import pandas as pd
+
+from parkit import (
+    Dict,
+    Directory,
+    File,
+    ObjectNotFoundError,
+    transaction
+)
+
+import underdog.constants as constants
+
+from underdog.analysis.accessor import (
+    DAILY_DATE,
+    INTRADAY_DATE,
+    MARKET_DATE
+)
+from underdog.analysis.columnar import (
+    ColumnarArray,
+    concatenate_columnar,
+    is_columnar
+)
+from underdog.utility import (
+    encode_date,
+    resolve_date
+)
+
+logger = logging.getLogger(__name__)
+
+MARKET_PATH: str = 'cache/market'
+
+MARKET_MANIFEST_PATH: str = 'cache/meta/market'
+
+HISTORY_SEGMENTS_PATH: str = 'cache/segments'
+
+HISTORY_INDEX_PATH: str = 'cache/meta/history'
+
+CACHE_MANIFEST_PATH: str = 'cache/meta/manifest'
+
+CACHE_STATE_PATH: str = 'cache/meta/state'
+
+CACHE_MANIFEST_VERSION: int = 1
+
+NDARRAY_CONTENT_TYPE: str = 'application/python-numpy-ndarray'
+
+PICKLE_CONTENT_TYPE: str = 'application/python-pickle'
+
+COLUMNAR_CONTENT_TYPE: str = 'application/x-underdog-columnar'
+
+def _array_content_type() -> str:
+    return COLUMNAR_CONTENT_TYPE if constants.CACHE_COLUMNAR_FORMAT else NDARRAY_CONTENT_TYPE
+
+def _write_array(
+    path: str,
+    array: np.ndarray,
+    site_uuid: Optional[str]
+) -> int:
+    if constants.CACHE_COLUMNAR_FORMAT:
+        content = bytes(ColumnarArray.fromarray(array).tobuffer())
+        nbytes = len(content)
+    else:
+        content = np.ascontiguousarray(array)
+        nbytes = content.nbytes
+    File(path, create = True, bind = True, site_uuid = site_uuid).set_content(content)
+    return nbytes
+
+def _open_array(
+    path: str,
+    site_uuid: Optional[str]
+) -> Optional[ColumnarArray]:
+    try:
+        content = File(path, create = False, bind = True, site_uuid = site_uuid).get_content()
+    except ObjectNotFoundError:
+        return None
+    if isinstance(content, np.ndarray) and content.ndim == 2:
+        return ColumnarArray.fromarray(content, compact = False)
+    if is_columnar(content):
+        return ColumnarArray.frombuffer(content)
+    return None
+
+def market_manifest(site_uuid: Optional[str] = None) -> Dict:
+    return Dict(
+        MARKET_MANIFEST_PATH,
+        create = True, bind = True,
+        site_uuid = site_uuid
+    )
+
+def market_partition_name(date: float) -> str:
+    return datetime.datetime.fromtimestamp(date).strftime('%Y-%m-%d')
+
+def market_partition_dates(site_uuid: Optional[str] = None) -> List[float]:
+    manifest = market_manifest(site_uuid)
+    names = set(Directory(MARKET_PATH, create = True, site_uuid = site_uuid).names())
+    with transaction(manifest):
+        for date in [date for date, entry in manifest.items() if entry['name'] not in names]:
+            del manifest[date]
+        return sorted(manifest.keys())
+
+def write_market_partition(
+    date: float,
+    array: np.ndarray,
+    site_uuid: Optional[str] = None
+):
+    manifest = market_manifest(site_uuid)
+    name = market_partition_name(date)
+    with transaction(manifest):
+        _write_array('/'.join([MARKET_PATH, name]), array, site_uuid)
+        manifest[date] = dict(name = name, rows = len(array))
+
+def drop_market_partition(
+    date: float,
+    site_uuid: Optional[str] = None
+):
+    manifest = market_manifest(site_uuid)
+    with transaction(manifest):
+        try:
+            File(
+                '/'.join([MARKET_PATH, market_partition_name(date)]),
+                create = False, bind = True, site_uuid = site_uuid
+            ).drop()
+        except ObjectNotFoundError:
+            pass
+        manifest.pop(date, None)
+
+def migrate_market(site_uuid: Optional[str] = None):
+    try:
+        file = File(MARKET_PATH, create = False, bind = True, site_uuid = site_uuid)
+    except ObjectNotFoundError:
+        return
+    array = file.get_content()
+    if array is not None and len(array) > 0:
+        logger.info('partitioning %s by date', MARKET_PATH)
+        array = array[np.argsort(array[:, MARKET_DATE], kind = 'stable')]
+        dates, index = np.unique(array[:, MARKET_DATE], return_index = True)
+        for date, partition in zip(dates, np.split(array, index[1:])):
+            write_market_partition(float(date), partition, site_uuid)
+    file.drop()
+
+def _encode_bound(
+    when: Optional[Union[str, datetime.date, np.datetime64]]
+) -> Optional[float]:
+    return None if when is None else encode_date(resolve_date(when))
+
+def read_market(
+    start: Optional[Union[str, datetime.date, np.datetime64]] = None,
+    end: Optional[Union[str, datetime.date, np.datetime64]] = None,
+    /, *,
+    site_uuid: Optional[str] = None
+) -> Optional[np.ndarray]:
+    manifest = market_manifest(site_uuid)
+    start_date, end_date = (_encode_bound(start), _encode_bound(end))
+    partitions = []
+    for date in sorted(manifest.keys()):
+        if (start_date is not None and date < start_date) or \
+        (end_date is not None and date > end_date):
+            continue
+        partition = _open_array('/'.join([MARKET_PATH, manifest[date]['name']]), site_uuid)
+        if partition is None:
+            logger.warning('missing market partition %s', manifest[date]['name'])
+        else:
+            partitions.append(partition.as_numpy())
+    if len(partitions) > 0:
+        return np.concatenate(partitions)
+    return None
+
+def history_index(site_uuid: Optional[str] = None) -> Dict:
+    return Dict(
+        HISTORY_INDEX_PATH,
+        create = True, bind = True,
+        site_uuid = site_uuid
+    )
+
+def cache_manifest(site_uuid: Optional[str] = None) -> Dict:
+    return Dict(
+        CACHE_MANIFEST_PATH,
+        create = True, bind = True,
+        site_uuid = site_uuid
+    )
+
+def cache_state(site_uuid: Optional[str] = None) -> Dict:
+    return Dict(
+        CACHE_STATE_PATH,
+        create = True, bind = True,
+        site_uuid = site_uuid
+    )
+
+def manifest_ready(site_uuid: Optional[str] = None) -> bool:
+    state = cache_state(site_uuid)
+    return 'manifest_version' in state and \
+    state['manifest_version'] == CACHE_MANIFEST_VERSION
+
+def manifest_entry(
+    path: str,
+    site_uuid: Optional[str] = None
+) -> Optional[typing.Dict[str, Any]]:
+    manifest = cache_manifest(site_uuid)
+    return manifest[path] if path in manifest else None
+
+def manifest_entries(
+    dataset: str,
+    site_uuid: Optional[str] = None
+) -> typing.Dict[str, typing.Dict[str, Any]]:
+    return {
+        entry['symbol']: entry
+        for path, entry in cache_manifest(site_uuid).items()
+        if entry['dataset'] == dataset
+    }
+
+def manifest_symbols(
+    datasets: Iterable[str],
+    site_uuid: Optional[str] = None
+) -> Set[str]:
+    datasets = set(datasets)
+    return {
+        entry['symbol']
+        for entry in cache_manifest(site_uuid).values()
+        if entry['dataset'] in datasets
+    }
+
+def _dataset_symbol(path: str) -> Tuple[str, str]:
+    dataset, symbol = path.split('/', 1)[1].rsplit('/', 1)
+    return (dataset, symbol)
+
+def _record_array(
+    manifest: typing.MutableMapping[str, Any],
+    path: str,
+    dates: np.ndarray,
+    nbytes: int,
+    content_type: str,
+    append: bool = False
+):
+    dataset, symbol = _dataset_symbol(path)
+    entry = manifest[path] if append and path in manifest else None
+    manifest[path] = dict(
+        dataset = dataset,
+        symbol = symbol,
+        first = float(dates[0]) if entry is None else entry['first'],
+        last = float(dates[-1]),
+        rows = len(dates) + (0 if entry is None else entry['rows']),
+        content_type = content_type,
+        bytes = nbytes + (0 if entry is None else entry['bytes']),
+        modified = time.time()
+    )
+
+def _record_content(
+    manifest: typing.MutableMapping[str, Any],
+    path: str,
+    content: Any,
+    modified: Optional[float] = None
+):
+    dataset, symbol = _dataset_symbol(path)
+    manifest[path] = dict(
+        dataset = dataset,
+        symbol = symbol,
+        first = None,
+        last = None,
+        rows = None,
+        content_type = PICKLE_CONTENT_TYPE,
+        bytes = len(pickle.dumps(content)),
+        modified = time.time() if modified is None else modified
+    )
+
+def write_cached(
+    path: str,
+    content: Any,
+    site_uuid: Optional[str] = None
+):
+    manifest = cache_manifest(site_uuid)
+    with transaction(manifest):
+        File(
+            path,
+            create = True, bind = True, site_uuid = site_uuid
+        ).set_content(content)
+        _record_content(manifest, path, content)
+
+def drop_cached(
+    path: str,
+    site_uuid: Optional[str] = None
+):
+    manifest = cache_manifest(site_uuid)
+    with transaction(manifest):
+        try:
+            File(path, create = False, bind = True, site_uuid = site_uuid).drop()
+        except ObjectNotFoundError:
+            pass
+        manifest.pop(path, None)
+
+def _modified_time(value: Any) -> float:
+    return pd.Timestamp(value).to_pydatetime().timestamp()
+
+def rebuild_manifest(
+    datasets: Iterable[str],
+    site_uuid: Optional[str] = None
+):
+    if manifest_ready(site_uuid):
+        return
+    logger.info('building cache manifest')
+    entries: typing.Dict[str, typing.Dict[str, Any]] = {}
+    for dataset in datasets:
+        for obj in Directory('/'.join(['cache', dataset]), create = True, site_uuid = site_uuid):
+            if not isinstance(obj, File):
+                continue
+            path = '/'.join(['cache', dataset, obj.name])
+            try:
+                metadata = obj.metadata
+                if metadata.get('content-type') == PICKLE_CONTENT_TYPE:
+                    if metadata['content-properties']['type'] == 'builtins.dict':
+                        _record_content(
+                            entries, path, obj.get_content(),
+                            _modified_time(metadata['last-modified'])
+                        )
+                    continue
+                history = open_history(path, site_uuid)
+                if history is not None and len(history) > 0:
+                    _record_array(
+                        entries, path,
+                        history.raw(history_date_column(history)),
+                        history.nbytes,
+                        NDARRAY_CONTENT_TYPE \
+                        if metadata.get('content-type') == NDARRAY_CONTENT_TYPE \
+                        else COLUMNAR_CONTENT_TYPE
+                    )
+            except Exception as exc:
+                logger.warning('skipping %s in cache manifest: %s', path, str(exc))
+    manifest = cache_manifest(site_uuid)
+    with transaction(manifest):
+        manifest.clear()
+        manifest.update(entries)
+        cache_state(site_uuid)['manifest_version'] = CACHE_MANIFEST_VERSION
+    logger.info('cache manifest has %i entries', len(entries))
+
+def history_date_column(array: Union[np.ndarray, ColumnarArray]) -> int:
+    if array.shape[1] == 7:
+        return DAILY_DATE
+    if array.shape[1] == 8:
+        return INTRADAY_DATE
+    raise ValueError()
+
+def history_segment_name(path: str, sequence: int) -> str:
+    namespace, symbol = path.split('/', 1)[1].rsplit('/', 1)
+    return '/'.join([
+        HISTORY_SEGMENTS_PATH, namespace,
+        '{0}-{1:06d}'.format(symbol, sequence)
+    ])
+
+def history_segments(
+    path: str,
+    site_uuid: Optional[str] = None
+) -> List[typing.Dict[str, Any]]:
+    index = history_index(site_uuid)
+    return list(index[path]['segments']) if path in index else []
+
+def _drop_segments(
+    segments: List[typing.Dict[str, Any]],
+    site_uuid: Optional[str]
+):
+    for segment in segments:
+        try:
+            File(
+                segment['name'],
+                create = False, bind = True, site_uuid = site_uuid
+            ).drop()
+        except ObjectNotFoundError:
+            pass
+
+def write_history(
+    path: str,
+    array: np.ndarray,
+    site_uuid: Optional[str] = None
+):
+    column = history_date_column(array)
+    index = history_index(site_uuid)
+    with transaction(index):
+        nbytes = _write_array(path, array, site_uuid)
+        if path in index:
+            _drop_segments(index[path]['segments'], site_uuid)
+        index[path] = dict(
+            start = float(array[0, column]),
+            end = float(array[-1, column]),
+            segments = [],
+            sequence = 0
+        )
+        _record_array(
+            cache_manifest(site_uuid), path,
+            array[:, column], nbytes, _array_content_type()
+        )
+
+def append_history(
+    path: str,
+    array: np.ndarray,
+    site_uuid: Optional[str] = None
+) -> int:
+    column = history_date_column(array)
+    index = history_index(site_uuid)
+    with transaction(index):
+        entry = index[path] if path in index else \
+        dict(start = None, end = None, segments = [], sequence = 0)
+        last = entry['segments'][-1] if len(entry['segments']) > 0 else None
+        part = None
+        if last is not None and \
+        last['rows'] + len(array) <= constants.HISTORY_SEGMENT_ROWS and \
+        float(array[0, column]) >= last['end']:
+            part = _open_array(last['name'], site_uuid)
+        if part is None:
+            name = history_segment_name(path, entry['sequence'])
+            nbytes = _write_array(name, array, site_uuid)
+            entry['segments'].append(dict(
+                name = name,
+                start = float(array[0, column]),
+                end = float(array[-1, column]),
+                rows = len(array),
+                bytes = nbytes
+            ))
+            entry['sequence'] += 1
+        else:
+            total = _write_array(
+                last['name'], np.concatenate([part.as_numpy(), array]), site_uuid
+            )
+            nbytes = total - last.get('bytes', part.nbytes)
+            entry['segments'][-1] = dict(
+                last,
+                end = float(array[-1, column]),
+                rows = last['rows'] + len(array),
+                bytes = total
+            )
+        index[path] = entry
+        _record_array(
+            cache_manifest(site_uuid), path,
+            array[:, column], nbytes, _array_content_type(),
+            append = True
+        )
+        return len(entry['segments'])
+
+def extend_history(
+    path: str,
+    array: np.ndarray,
+    site_uuid: Optional[str] = None
+) -> int:
+    if manifest_entry(path, site_uuid) is None:
+        write_history(path, array, site_uuid)
+        return 0
+    return append_history(path, array, site_uuid)
+
+def history_end(
+    path: str,
+    site_uuid: Optional[str] = None
+) -> Optional[float]:
+    entry = manifest_entry(path, site_uuid)
+    return None if entry is None else entry['last']
+
+def _history_windows(
+    path: str,
+    site_uuid: Optional[str]
+) -> List[Tuple[str, Optional[float], Optional[float]]]:
+    index = history_index(site_uuid)
+    entry = index[path] if path in index else dict(segments = [])
+    return [(path, entry.get('start'), entry.get('end'))] + [
+        (segment['name'], segment['start'], segment['end'])
+        for segment in entry['segments']
+    ]
+
+def _open_part(
+    name: str,
+    path: str,
+    site_uuid: Optional[str]
+) -> Optional[ColumnarArray]:
+    part = _open_array(name, site_uuid)
+    if part is None and name != path:
+        logger.warning('missing history segment %s', name)
+    return None if part is None or len(part) == 0 else part
+
+def _history_parts(
+    path: str,
+    site_uuid: Optional[str]
+) -> List[ColumnarArray]:
+    parts = []
+    for name, _, _ in _history_windows(path, site_uuid):
+        part = _open_part(name, path, site_uuid)
+        if part is not None:
+            parts.append(part)
+    return parts
+
+def open_history(
+    path: str,
+    site_uuid: Optional[str] = None
+) -> Optional[ColumnarArray]:
+    parts = _history_parts(path, site_uuid)
+    if len(parts) == 0:
+        return None
+    history = concatenate_columnar(parts)
+    dates = history.raw(history_date_column(history))
+    if (dates[1:] < dates[:-1]).any():
+        history = history.take(np.argsort(dates, kind = 'stable'))
+    return history
+
+def read_history(
+    path: str,
+    site_uuid: Optional[str] = None
+) -> Optional[np.ndarray]:
+    history = open_history(path, site_uuid)
+    return None if history is None else history.as_numpy()
+
+def _overlaps(
+    start: Optional[float],
+    end: Optional[float],
+    start_date: Optional[float],
+    end_date: Optional[float]
+) -> bool:
+    return not (
+        (start_date is not None and end is not None and end < start_date) or \
+        (end_date is not None and start is not None and start > end_date)
+    )
+
+def _slice_parts(
+    parts: List[ColumnarArray],
+    start_date: Optional[float],
+    end_date: Optional[float],
+    columns: Optional[Iterable[int]]
+) -> Optional[np.ndarray]:
+    slices = []
+    for part in parts:
+        dates = part.raw(history_date_column(part))
+        lower = 0 if start_date is None else int(np.searchsorted(dates, start_date, side = 'left'))
+        upper = len(dates) if end_date is None else \
+        int(np.searchsorted(dates, end_date, side = 'right'))
+        if upper > lower:
+            slices.append(part.slice(lower, upper))
+    if len(slices) == 0:
+        return None
+    columns = None if columns is None else list(columns)
+    if len(slices) == 1:
+        return slices[0].as_numpy(columns = columns)
+    array = np.concatenate([part.as_numpy(columns = columns) for part in slices])
+    dates = np.concatenate([part.raw(history_date_column(part)) for part in slices])
+    if (dates[1:] < dates[:-1]).any():
+        array = array[np.argsort(dates, kind = 'stable')]
+    return array
+
+def _read_range(
+    path: str,
+    start_date: Optional[float],
+    end_date: Optional[float],
+    columns: Optional[Iterable[int]],
+    site_uuid: Optional[str]
+) -> Optional[np.ndarray]:
+    parts = []
+    for name, start, end in _history_windows(path, site_uuid):
+        if not _overlaps(start, end, start_date, end_date):
+            continue
+        part = _open_part(name, path, site_uuid)
+        if part is not None:
+            parts.append(part)
+    return _slice_parts(parts, start_date, end_date, columns)
+
+def read_history_range(
+    path: str,
+    start: Optional[Union[str, datetime.date, np.datetime64]] = None,
+    end: Optional[Union[str, datetime.date, np.datetime64]] = None,
+    /, *,
+    columns: Optional[Iterable[int]] = None,
+    site_uuid: Optional[str] = None
+) -> Optional[np.ndarray]:
+    return _read_range(path, _encode_bound(start), _encode_bound(end), columns, site_uuid)
+
+def tail_history(
+    path: str,
+    n_days: int,
+    /, *,
+    columns: Optional[Iterable[int]] = None,
+    site_uuid: Optional[str] = None
+) -> Optional[np.ndarray]:
+    if n_days < 1:
+        raise ValueError()
+    seen: Set[float] = set()
+    windows = _history_windows(path, site_uuid)
+    opened: typing.Dict[int, ColumnarArray] = {}
+    for i in reversed(range(len(windows))):
+        part = _open_part(windows[i][0], path, site_uuid)
+        if part is None:
+            continue
+        opened[i] = part
+        dates = part.raw(history_date_column(part))
+        index = len(dates)
+        while index > 0 and len(seen) < n_days:
+            seen.add(float(dates[index - 1]))
+            index = int(np.searchsorted(dates, dates[index - 1], side = 'left'))
+        if len(seen) >= n_days:
+            break
+    if len(seen) == 0:
+        return None
+    start_date = sorted(seen)[-n_days:][0]
+    parts = []
+    for i, (name, start, end) in enumerate(windows):
+        if i in opened:
+            parts.append(opened[i])
+        elif _overlaps(start, end, start_date, None):
+            part = _open_part(name, path, site_uuid)
+            if part is not None:
+                parts.append(part)
+    return _slice_parts(parts, start_date, None, columns)
+
+def _intraday_path(symbol: str, period: int) -> str:
+    if period not in [1, 5]:
+        raise ValueError()
+    return 'cache/intraday/{0}/{1}'.format(period, symbol)
+
+def read_daily(
+    symbol: str,
+    start: Optional[Union[str, datetime.date, np.datetime64]] = None,
+    end: Optional[Union[str, datetime.date, np.datetime64]] = None,
+    /, *,
+    columns: Optional[Iterable[int]] = None,
+    site_uuid: Optional[str] = None
+) -> Optional[np.ndarray]:
+    return read_history_range(
+        'cache/daily/{0}'.format(symbol), start, end,
+        columns = columns, site_uuid = site_uuid
+    )
+
+def read_intraday(
+    symbol: str,
+    period: int = 1,
+    start: Optional[Union[str, datetime.date, np.datetime64]] = None,
+    end: Optional[Union[str, datetime.date, np.datetime64]] = None,
+    /, *,
+    columns: Optional[Iterable[int]] = None,
+    site_uuid: Optional[str] = None
+) -> Optional[np.ndarray]:
+    return read_history_range(
+        _intraday_path(symbol, period), start, end,
+        columns = columns, site_uuid = site_uuid
+    )
+
+def tail_daily(
+    symbol: str,
+    n_days: int,
+    /, *,
+    columns: Optional[Iterable[int]] = None,
+    site_uuid: Optional[str] = None
+) -> Optional[np.ndarray]:
+    return tail_history(
+        'cache/daily/{0}'.format(symbol), n_days,
+        columns = columns, site_uuid = site_uuid
+    )
+
+def tail_intraday(
+    symbol: str,
+    period: int,
+    n_days: int,
+    /, *,
+    columns: Optional[Iterable[int]] = None,
+    site_uuid: Optional[str] = None
+) -> Optional[np.ndarray]:
+    return tail_history(
+        _intraday_path(symbol, period), n_days,
+        columns = columns, site_uuid = site_uuid
+    )
+
+def merge_history(
+    path: str,
+    site_uuid: Optional[str] = None
+):
+    index = history_index(site_uuid)
+    with transaction(index):
+        if path not in index or len(index[path]['segments']) == 0:
+            return
+        array = read_history(path, site_uuid)
+        segments = index[path]['segments']
+        if array is None:
+            index.pop(path)
+        else:
+            column = history_date_column(array)
+            nbytes = _write_array(path, array, site_uuid)
+            index[path] = dict(
+                index[path],
+                start = float(array[0, column]),
+                end = float(array[-1, column]),
+                segments = []
+            )
+            manifest = cache_manifest(site_uuid)
+            if path in manifest:
+                manifest[path] = dict(
+                    manifest[path],
+                    bytes = nbytes,
+                    content_type = _array_content_type()
+                )
+        _drop_segments(segments, site_uuid)
+
+def fragmented_histories(
+    site_uuid: Optional[str] = None,
+    min_segments: int = constants.HISTORY_MERGE_SEGMENTS
+) -> List[str]:
+    return sorted(
+        path for path, entry in history_index(site_uuid).items()
+        if len(entry['segments']) >= min_segments
+    )
+
+def merge_histories(
+    paths: Iterable[str],
+    site_uuid: Optional[str] = None,
+    min_segments: int = constants.HISTORY_MERGE_SEGMENTS
+):
+    for path in paths:
+        if len(history_segments(path, site_uuid)) >= min_segments:
+            logger.info('merge history %s', path)
+            merge_history(path, site_uuid)
+
+def drop_history(
+    path: str,
+    site_uuid: Optional[str] = None
+):
+    index = history_index(site_uuid)
+    with transaction(index):
+        try:
+            File(path, create = False, bind = True, site_uuid = site_uuid).drop()
+        except ObjectNotFoundError:
+            pass
+        if path in index:
+            _drop_segments(index.pop(path)['segments'], site_uuid)
+        cache_manifest(site_uuid).pop(path, None)
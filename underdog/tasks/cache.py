@@ -1,34 +1,64 @@
+import concurrent.futures
 import datetime
 import logging
+import math
+import time
 
 from typing import (
-    Iterable, Optional, Set
+    Callable, Dict, Iterable, List, Optional, Set
 )
 
-import pandas as pd
-
 from parkit import (
     asyncable,
     compactify,
     Directory,
     File,
-    ObjectNotFoundError,
-    transaction
+    get_concurrency
 )
 
-from underdog.finviz.fetch import (
-    fetch_ticker_details,
-    fetch_ticker_news
+import underdog.constants as constants
+
+from underdog.analysis.accessor import INTRADAY_DATE
+from underdog.analysis.stdlib import chunks
+from underdog.finviz.fetch import fetch_ticker_pages
+from underdog.httpcache import response_cache
+from underdog.polygon.fetch import (
+    fetch_market_dates,
+    market_window
+)
+from underdog.storage import (
+    cache_manifest,
+    drop_cached,
+    drop_history,
+    drop_market_partition,
+    extend_history,
+    fragmented_histories,
+    history_index,
+    manifest_entries,
+    manifest_entry,
+    manifest_ready,
+    manifest_symbols,
+    market_manifest,
+    market_partition_dates,
+    market_partition_name,
+    merge_histories,
+    migrate_market,
+    PICKLE_CONTENT_TYPE,
+    read_history,
+    rebuild_manifest,
+    write_cached,
+    write_history,
+    write_market_partition
 )
-from underdog.polygon.fetch import fetch_market
 from underdog.tda.fetch import (
-    fetch_daily,
-    fetch_intraday
+    fetch_daily_many,
+    fetch_intraday_many
 )
 from underdog.utility import (
-    as_pandas,
+    encode_date,
     nth_next_trading_date,
-    nth_previous_trading_date
+    nth_previous_trading_date,
+    resample_intraday
 )
 
 logger = logging.getLogger(__name__)
@@ -47,187 +77,192 @@ def clean_directories(site_uuid: Optional[str]):
         logger.info('removing %s from cache', obj.name)
         obj.drop()
 
+    if not manifest_ready(site_uuid):
+        logger.warning('cache manifest not built, skipping manifest cleanup')
+        return
+
+    expected: Dict[str, Set[str]] = {}
+    owners: Dict[str, str] = {}
+    for path in cache_manifest(site_uuid).keys():
+        directory, name = path.rsplit('/', 1)
+        expected.setdefault(directory, set()).add(name)
+        owners[path] = path
+    for path, entry in history_index(site_uuid).items():
+        for segment in entry['segments']:
+            directory, name = segment['name'].rsplit('/', 1)
+            expected.setdefault(directory, set()).add(name)
+            owners[segment['name']] = path
+    expected['cache/market'] = {
+        entry['name'] for entry in market_manifest(site_uuid).values()
+    }
+
+    damaged: Set[str] = set()
     for directory in [
         Directory(path, create = True, site_uuid = site_uuid)
         for path in [
             'cache/daily', 'cache/intraday/5',
-            'cache/intraday/1'
+            'cache/intraday/1', 'cache/market',
+            'cache/segments/daily', 'cache/segments/intraday/5',
+            'cache/segments/intraday/1', 'cache/tickers'
         ]
     ]:
         logger.info('cleaning %s', directory.path)
+        names = set(directory.names())
+        valid = expected.get(directory.path, set())
+        if directory.path != 'cache/market':
+            damaged.update(
+                owners['/'.join([directory.path, name])]
+                for name in valid.difference(names)
+            )
+        if len(names.difference(valid)) == 0:
+            continue
         for obj in directory:
-            if isinstance(obj, File):
-                try:
-                    if obj.metadata['content-type'] == 'application/python-numpy-ndarray':
-                        continue
-                except KeyError:
-                    pass
-            logger.info('removing %s from %s', obj.name, directory.path)
-            obj.drop()
-
-    logger.info('cleaning %s', 'cache/tickers')
-    for obj in Directory('cache/tickers', create = True, site_uuid = site_uuid):
-        if isinstance(obj, File):
-            try:
-                metadata = obj.metadata
-                if metadata['content-type'] == 'application/python-pickle' and \
-                metadata['content-properties']['type'] == 'builtins.dict':
-                    continue
-            except KeyError:
-                pass
-        logger.info('removing %s from cache/tickers', obj.name)
-        obj.drop()
+            if obj.name not in valid:
+                logger.info('removing %s from %s', obj.name, directory.path)
+                obj.drop()
+
+    for path in sorted(damaged):
+        logger.info('removing damaged %s from cache', path)
+        drop_history(path, site_uuid)
+
+def plan_fetch(
+    symbols: Set[str],
+    path: str,
+    site_uuid: Optional[str]
+) -> Dict[str, Optional[datetime.date]]:
+    entries = manifest_entries(path.split('/', 1)[1], site_uuid)
+    starts = {}
+    for symbol in sorted(symbols):
+        end = entries[symbol]['last'] if symbol in entries else None
+        start = None if end is None else \
+        nth_next_trading_date(
+            1,
+            anchor = datetime.datetime.fromtimestamp(end).date()
+        )
+        if start is not None and start > nth_previous_trading_date(1):
+            logger.info('skipping %s', symbol)
+            continue
+        starts[symbol] = start
+    return starts
 
 def update_daily(
     symbols: Set[str],
     site_uuid: Optional[str]
 ):
+    for symbol, df in fetch_daily_many(plan_fetch(symbols, 'cache/daily', site_uuid)):
 
-    for symbol in symbols:
-
-        with transaction(Directory('cache/daily')):
-
-            try:
-                agg_df = as_pandas(
-                    File(
-                        'cache/daily/{0}'.format(symbol),
-                        create = False, bind = True,
-                        site_uuid = site_uuid
-                    ).get_content()
-                )
-            except ObjectNotFoundError:
-                agg_df = None
-
-            start = None if agg_df is None else \
-            nth_next_trading_date(
-                1,
-                anchor = datetime.datetime.fromtimestamp(agg_df['date'].max()).date()
-            )
-
-            if start is not None and start > nth_previous_trading_date(1):
-                logger.info('skipping %s', symbol)
-                continue
-
-            logger.info('fetch %s daily', symbol)
+        if df is None:
+            continue
 
-            df = fetch_daily(symbol, start = start)
+        logger.info('fetch %s daily', symbol)
 
-            if df is not None:
-                if agg_df is None:
-                    agg_df = df
-                else:
-                    agg_df = pd.concat([agg_df, df])
-                agg_df = agg_df.sort_values('date').reset_index(drop = True)
-                File(
-                    'cache/daily/{0}'.format(symbol),
-                    create = True, bind = True, site_uuid = site_uuid
-                ).set_content(agg_df.to_numpy())
+        extend_history('cache/daily/{0}'.format(symbol), df.to_numpy(), site_uuid)
 
 def update_intraday(
     symbols: Set[str],
     site_uuid: Optional[str]
 ):
-    for period in [1, 5]:
-
-        for symbol in symbols:
-
-            with transaction(Directory('cache/intraday/{0}'.format(period))):
-
-                try:
-                    agg_df = as_pandas(
-                        File(
-                            'cache/intraday/{0}/{1}'.format(period, symbol),
-                            create = False, bind = True,
-                            site_uuid = site_uuid
-                        ).get_content()
-                    )
-                except ObjectNotFoundError:
-                    agg_df = None
-
-                start = None if agg_df is None else \
-                nth_next_trading_date(
-                    1,
-                    anchor = datetime.datetime.fromtimestamp(agg_df['date'].max()).date()
-                )
-
-                if start is not None and start > nth_previous_trading_date(1):
-                    logger.info('skipping %s', symbol)
-                    continue
-
-                logger.info('fetch %s intraday %i', symbol, period)
-                df = fetch_intraday(
-                    symbol,
-                    start = start,
-                    period = period,
-                )
-
-                if df is not None:
-                    if agg_df is None:
-                        agg_df = df
-                    else:
-                        agg_df = pd.concat([agg_df, df])
-                    agg_df = agg_df.sort_values(['date', 'timeslot']).\
-                    reset_index(drop = True)
-                    File(
-                        'cache/intraday/{0}/{1}'.format(period, symbol),
-                        create = True, bind = True, site_uuid = site_uuid
-                    ).set_content(agg_df.to_numpy())
+    for symbol, df in fetch_intraday_many(
+        plan_fetch(symbols, 'cache/intraday/1', site_uuid),
+        period = 1
+    ):
+
+        if df is None:
+            continue
+
+        logger.info('fetch %s intraday', symbol)
+
+        array = df.to_numpy()
+        extend_history('cache/intraday/1/{0}'.format(symbol), array, site_uuid)
+        entry = manifest_entry('cache/intraday/5/{0}'.format(symbol), site_uuid)
+        if entry is not None:
+            array = resample_intraday(array, 5)
+            array = array[array[:, INTRADAY_DATE] > entry['last']]
+            if len(array) > 0:
+                extend_history('cache/intraday/5/{0}'.format(symbol), array, site_uuid)
+
+    missing = set(
+        manifest_entries('intraday/1', site_uuid)
+    ).intersection(symbols).difference(
+        manifest_entries('intraday/5', site_uuid)
+    )
+    for symbol in sorted(missing):
+        logger.info('derive %s intraday', symbol)
+        array = read_history('cache/intraday/1/{0}'.format(symbol), site_uuid)
+        if array is not None:
+            write_history(
+                'cache/intraday/5/{0}'.format(symbol),
+                resample_intraday(array, 5),
+                site_uuid
+            )
 
 def update_market(site_uuid: Optional[str]):
-    with transaction('cache'):
-        try:
-            df = as_pandas(
-                File(
-                    'cache/market', create = False, bind = True, site_uuid = site_uuid
-                ).get_content()
-            )
-        except ObjectNotFoundError:
-            df = None
-        df = fetch_market(df)
-        if df is not None:
-            File(
-                'cache/market', create = True, bind = True, site_uuid = site_uuid
-            ).set_content(df.to_numpy())
+    migrate_market(site_uuid)
+    window = {encode_date(date): date for date in market_window()}
+    cached_dates = set(market_partition_dates(site_uuid))
+    for date, array in fetch_market_dates([
+        date for encoded, date in window.items() if encoded not in cached_dates
+    ]).items():
+        logger.info('add market partition %s', str(date))
+        write_market_partition(encode_date(date), array, site_uuid)
+    for date in cached_dates.difference(window):
+        logger.info('drop market partition %s', market_partition_name(date))
+        drop_market_partition(date, site_uuid)
 
 def update_tickers(
     symbols: Set[str],
     site_uuid: Optional[str]
 ):
-    for symbol in symbols:
-        with transaction('cache/tickers'):
-            try:
-                file = File(
-                    'cache/tickers/{0}'.format(symbol),
-                    create = False, bind = True,
-                    site_uuid = site_uuid
-                )
-                metadata = file.metadata
-                if metadata['content-type'] == 'application/python-pickle' and \
-                metadata['content-properties']['type'] == 'builtins.dict' and \
-                (pd.Timestamp.now() - pd.Timestamp(metadata['last-modified'])).days < 7:
-                    continue
-            except (KeyError, ObjectNotFoundError):
-                pass
-            data = dict(
-                details = fetch_ticker_details(symbol),
-                news = fetch_ticker_news(symbol)
-            )
+    entries = manifest_entries('tickers', site_uuid)
+    stale = []
+    for symbol in sorted(symbols):
+        if symbol in entries and \
+        entries[symbol]['content_type'] == PICKLE_CONTENT_TYPE and \
+        time.time() - entries[symbol]['modified'] < 7 * 86400:
+            continue
+        stale.append(symbol)
+
+    for i in range(0, len(stale), constants.FINVIZ_FETCH_BATCH_SIZE):
+        pages = fetch_ticker_pages(stale[i:i + constants.FINVIZ_FETCH_BATCH_SIZE])
+        for symbol, data in pages.items():
             if data['details'] is None and data['news'] is None:
-                try:
-                    File(
-                        'cache/tickers/{0}'.format(symbol),
-                        create = False, bind = True,
-                        site_uuid = site_uuid
-                    ).drop()
-                except ObjectNotFoundError:
-                    pass
+                drop_cached('cache/tickers/{0}'.format(symbol), site_uuid)
             else:
                 logger.info('fetch %s tickers', symbol)
-                File(
-                    'cache/tickers/{0}'.format(symbol),
-                    create = True, bind = True,
-                    site_uuid = site_uuid
-                ).set_content(data)
+                write_cached('cache/tickers/{0}'.format(symbol), data, site_uuid)
+
+def update_symbols(
+    symbols: Iterable[Optional[str]],
+    stages: List[Callable[[Set[str], Optional[str]], None]],
+    site_uuid: Optional[str]
+):
+    include_symbols = {symbol for symbol in symbols if symbol is not None}
+    logger.info('update %i symbols', len(include_symbols))
+    for stage in stages:
+        logger.info('start %s', stage.__name__)
+        stage(include_symbols, site_uuid)
+
+def update_symbol_chunks(
+    symbols: Set[str],
+    site_uuid: Optional[str],
+    concurrency: Optional[int] = None
+):
+    concurrency = get_concurrency() if concurrency is None else concurrency
+    stages = [update_tickers, update_daily, update_intraday]
+    with concurrent.futures.ThreadPoolExecutor(max_workers = concurrency) as pool:
+        futures = [
+            pool.submit(
+                update_symbols,
+                chunk, stages[i % len(stages):] + stages[:i % len(stages)], site_uuid
+            )
+            for i, chunk in enumerate(chunks(
+                int(math.ceil(len(symbols) / concurrency)) \
+                if len(symbols) > concurrency else 1,
+                sorted(symbols)
+            ))
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
 
 @asyncable(
     async_limit = 1,
@@ -247,13 +282,17 @@ def update_cache(
 
     compactify(site_uuid)
 
+    rebuild_manifest(
+        [path.split('/', 1)[1] for path in paths],
+        site_uuid
+    )
+
     clean_directories(site_uuid)
 
-    cache_symbols: Set[str] = set()
-    for path in paths:
-        cache_symbols.update(
-            Directory(path, create = True, site_uuid = site_uuid).names()
-        )
+    cache_symbols = manifest_symbols(
+        [path.split('/', 1)[1] for path in paths],
+        site_uuid
+    )
 
     include_symbols = set(symbols)
     exclude_symbols = cache_symbols.difference(include_symbols)
@@ -265,22 +304,33 @@ def update_cache(
     logger.info('removing %i symbols', len(exclude_symbols))
     logger.info('adding %i symbols', len(include_symbols.difference(cache_symbols)))
 
-    for directory in [
-        Directory(path, create = True, site_uuid = site_uuid) for path in paths
-    ]:
+    for path in paths:
         for symbol in exclude_symbols:
-            try:
-                logger.info('removing %s from %s', symbol, directory.path)
-                directory[symbol].drop()
-            except ObjectNotFoundError:
-                pass
+            logger.info('removing %s from %s', symbol, path)
+            drop_history('/'.join([path, symbol]), site_uuid)
 
-    update_tickers(include_symbols, site_uuid)
+    update_symbol_chunks(include_symbols, site_uuid)
 
-    logger.info('update daily')
-    update_daily(include_symbols, site_uuid)
+    if len(fragmented_histories(site_uuid)) > 0:
+        compact_cache(site_uuid = site_uuid)
 
-    logger.info('update intraday')
-    update_intraday(include_symbols, site_uuid)
+    logger.info('http cache %s', str(response_cache().stats))
 
     logger.info('finish update_cache')
+
+@asyncable(
+    async_limit = 1,
+    disable_sync = True,
+    fullpath = True
+)
+def compact_cache(
+    site_uuid: Optional[str] = None,
+    min_segments: int = constants.HISTORY_MERGE_SEGMENTS
+):
+    logger.info('start compact_cache')
+
+    paths = fragmented_histories(site_uuid, min_segments)
+    logger.info('merging %i histories', len(paths))
+    merge_histories(paths, site_uuid, min_segments)
+
+    logger.info('finish compact_cache')
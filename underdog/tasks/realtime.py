@@ -22,6 +22,10 @@ import underdog.constants as constants
 import underdog.tda.stream as tda
 
 from underdog.tda.fetch import fetch_intraday
+from underdog.utility import (
+    as_pandas,
+    resample_intraday
+)
 
 logger = logging.getLogger(__name__)
 
@@ -129,7 +133,7 @@ def get_intraday(
     /, *,
     period: int = 1
 ) -> pd.DataFrame:
-    if period not in [1, 5]:
+    if period not in [1, 5, 15, 30, 60]:
         raise ValueError()
     sample_period = period
     if sample_period % 5 == 0:
@@ -144,4 +148,8 @@ def get_intraday(
     )
     if df is None:
         raise ObjectNotFoundError()
+    if sample_period != source_period:
+        return as_pandas(
+            resample_intraday(df.to_numpy(), sample_period, source_period)
+        )
     return df
@@ -1,23 +1,30 @@
+import concurrent.futures
 import datetime
 import logging
-import time
 
 from typing import (
-    Any, Dict, List, Optional, Union
+    Any, Callable, Dict, Iterable, Iterator,
+    List, Mapping, Optional, Tuple, Union
 )
 
+import numba
 import numpy as np
 import pandas as pd
 
 import underdog.constants as constants
 
-from underdog.ratelimiter import RateLimiter
+from underdog.ratelimiter import (
+    parse_retry_after,
+    RateLimiter,
+    RateLimitExceeded
+)
 from underdog.tda.tdaclient import tda
 from underdog.utility import (
+    encode_dates,
     is_trading_date,
     nth_previous_trading_date,
     resolve_date,
-    timestamp_to_timeslot,
+    timestamps_to_timeslots,
     twap
 )
 
@@ -26,7 +33,9 @@ logger = logging.getLogger(__name__)
 rate_limiter: RateLimiter = RateLimiter(
     'tda_rate_limiter',
     constants.TDA_REQUEST_INTERVAL,
-    constants.TDA_MAX_REQUESTS_PER_INTERVAL
+    constants.TDA_MAX_REQUESTS_PER_INTERVAL,
+    adaptive = constants.TDA_ADAPTIVE_RATE_LIMIT,
+    ceiling = constants.TDA_MAX_REQUESTS_CEILING
 )
 
 timeslots = {
@@ -34,104 +43,164 @@ timeslots = {
     5: 192
 }
 
-def fill_missing_intraday(
-    df: pd.DataFrame,
-    period: int
-) -> pd.DataFrame:
-    df = df.sort_values('timeslot')
-    date = df.iloc[0]['date']
-    df = df.set_index('timeslot')
-    added = set(range(timeslots[period])).difference(set(df.index.to_list()))
-    df = df.reindex(range(timeslots[period])).reset_index(drop = False)
-    df['date'] = date
-    df['volume'] = np.where(
-        df.index.isin(added),
-        0., df['volume']
-    )
-    df['twap'] = df['twap'].fillna(method = 'ffill').fillna(method = 'bfill')
-    return df
+intraday_columns = [
+    'timeslot', 'open', 'high', 'low', 'close', 'volume', 'twap', 'date'
+]
+
+@numba.njit
+def _scatter_intraday(
+    grid: np.ndarray,
+    day_index: np.ndarray,
+    slots: np.ndarray,
+    values: np.ndarray
+) -> np.ndarray:
+    n_days, n_slots = grid.shape[0], grid.shape[1]
+    present = np.zeros((n_days, n_slots), dtype = np.bool_)
+    for i in range(len(day_index)):
+        day, slot = day_index[i], slots[i]
+        if day >= 0 and 0 <= slot < n_slots:
+            grid[day, slot, 1:7] = values[i]
+            present[day, slot] = True
+    keep = np.zeros(n_days, dtype = np.bool_)
+    for day in range(n_days):
+        first = -1
+        last = np.nan
+        for slot in range(n_slots):
+            if present[day, slot]:
+                if first < 0:
+                    first = slot
+                last = grid[day, slot, 6]
+            else:
+                grid[day, slot, 5] = 0.
+                grid[day, slot, 6] = last
+        if first >= 0:
+            grid[day, :first, 6] = grid[day, first, 6]
+            keep[day] = True
+    return keep
 
 def normalize_intraday(
     df: pd.DataFrame,
     period: int
 ) -> Optional[pd.DataFrame]:
-    concat = []
-    for date in df['date'].unique():
-        if is_trading_date(datetime.datetime.fromtimestamp(date).date()):
-            xf = df[df['date'] == date]
-            xf = fill_missing_intraday(xf, period)
-            with pd.option_context('mode.use_inf_as_null', True):
-                if len(xf.dropna()) > 0:
-                    concat.append(xf)
-    if len(concat) > 0:
-        df = pd.concat(concat, ignore_index = True)
-        return df.sort_values(['date', 'timeslot']).reset_index(drop = True)
+    dates, inverse = np.unique(df['date'].to_numpy(np.float64), return_inverse = True)
+    trading = np.array([
+        is_trading_date(datetime.datetime.fromtimestamp(date).date())
+        for date in dates
+    ], dtype = bool)
+    if not trading.any():
+        return None
+    positions = np.where(trading, np.cumsum(trading) - 1, -1)
+    grid = np.full((int(trading.sum()), timeslots[period], 8), np.nan)
+    grid[:, :, 0] = np.arange(timeslots[period])
+    grid[:, :, 7] = dates[trading][:, np.newaxis]
+    keep = _scatter_intraday(
+        grid,
+        positions[inverse],
+        df['timeslot'].to_numpy(np.int64),
+        df[['open', 'high', 'low', 'close', 'volume', 'twap']].to_numpy(np.float64)
+    )
+    if keep.any():
+        return pd.DataFrame(
+            columns = intraday_columns,
+            data = grid[keep].reshape(-1, 8)
+        )
     return None
 
-def fetch_intraday(
-    symbol: str,
-    /, *,
-    period: int = 1,
-    start: Optional[Union[str,datetime.date]] = None,
-    end: Optional[Union[str, datetime.date]] = None,
-    max_attempts: int = constants.TDA_FETCH_RETRY_LIMIT
+def build_intraday_dataframe(
+    rows: List[Dict[str, Any]],
+    period: int = 1
 ) -> Optional[pd.DataFrame]:
 
-    def build_dataframe(
-        rows: List[Dict[str, Any]],
-        period: int = 1
-    ) -> Optional[pd.DataFrame]:
+    if len(rows) == 0:
+        return None
+
+    df = pd.DataFrame(rows)
+
+    df = df.astype({
+        'datetime': np.float64,
+        'volume': np.float64,
+        'open': np.float64,
+        'close': np.float64,
+        'high': np.float64,
+        'low': np.float64,
+    })
+
+    df = df[
+        (df['datetime'] >= 0) & \
+        (df['volume'] >= 0) & \
+        (df['open'] > 0) & \
+        (df['close'] > 0) & \
+        (df['high'] > 0) & \
+        (df['low'] > 0)
+    ]
+
+    with pd.option_context('mode.use_inf_as_null', True):
+        df = df.dropna()
+
+    if len(df) == 0:
+        return None
+
+    df = twap(df)
 
-        if len(rows) == 0:
-            return None
+    df['timeslot'] = timestamps_to_timeslots(df['datetime'].to_numpy(), period = period)
+    df['date'] = encode_dates(df['datetime'].to_numpy())
+    df = df.drop('datetime', axis = 1)
 
-        df = pd.DataFrame(rows)
+    df = normalize_intraday(df, period)
 
+    if df is not None:
         df = df.astype({
-            'datetime': np.float64,
-            'volume': np.float64,
-            'open': np.float64,
-            'close': np.float64,
-            'high': np.float64,
-            'low': np.float64,
+            'timeslot': np.float64
         })
+        return df
+    return None
 
-        df = df[
-            (df['datetime'] >= 0) & \
-            (df['volume'] >= 0) & \
-            (df['open'] > 0) & \
-            (df['close'] > 0) & \
-            (df['high'] > 0) & \
-            (df['low'] > 0)
-        ]
+def build_daily_dataframe(
+    rows: List[Dict[str, Any]]
+) -> Optional[pd.DataFrame]:
 
-        with pd.option_context('mode.use_inf_as_null', True):
-            df = df.dropna()
+    if len(rows) == 0:
+        return None
 
-        if len(df) == 0:
-            return None
+    df = pd.DataFrame(rows)
+
+    df = df.astype({
+        'volume': np.float64,
+        'open': np.float64,
+        'close': np.float64,
+        'high': np.float64,
+        'low': np.float64,
+    })
+    df = df[
+        (df['datetime'] >= 0) & \
+        (df['volume'] >= 0) & \
+        (df['open'] > 0) & \
+        (df['close'] > 0) & \
+        (df['high'] > 0) & \
+        (df['low'] > 0)
+    ]
+
+    with pd.option_context('mode.use_inf_as_null', True):
+        df = df.dropna()
+
+    if len(df) == 0:
+        return None
 
-        df = twap(df)
+    df['date'] = encode_dates(df['datetime'].to_numpy())
+    df = df.drop('datetime', axis = 1)
 
-        df['timeslot'] = df['datetime'].apply(
-            lambda x: timestamp_to_timeslot(
-                pd.Timestamp(x, tz = 'US/Eastern', unit = 'ms'),
-                period = period
-            )
-        )
-        df['date'] = df['datetime'].apply(
-            lambda x: time.mktime(datetime.datetime.fromtimestamp(x / 1e3).date().timetuple())
-        )
-        df = df.drop('datetime', axis = 1)
+    df = twap(df)
 
-        df = normalize_intraday(df, period)
+    return df.sort_values('date', ascending = True).reset_index(drop = True)
 
-        if df is not None:
-            df = df.astype({
-                'timeslot': np.float64
-            })
-            return df
-        return None
+def request_intraday(
+    symbol: str,
+    /, *,
+    period: int = 1,
+    start: Optional[Union[str,datetime.date]] = None,
+    end: Optional[Union[str, datetime.date]] = None,
+    max_attempts: int = constants.TDA_FETCH_RETRY_LIMIT
+) -> Optional[List[Dict[str, Any]]]:
 
     if period not in [1, 5]:
         raise ValueError()
@@ -159,59 +228,28 @@ def fetch_intraday(
                 end_datetime = datetime.datetime.combine(end, datetime.time()),
                 need_extended_hours_data = True
             )
+            if result.status_code == 429:
+                raise RateLimitExceeded(
+                    'server response code {0}'.format(result.status_code),
+                    parse_retry_after(result.headers.get('Retry-After'))
+                )
             assert result.status_code == 200, result.raise_for_status()
-            df = build_dataframe(result.json()['candles'], period)
+            candles = result.json()['candles']
             if context.attempts > 1:
-                logger.warning('%i attempts fetching daily data for %s', context.attempts, symbol)
-            return df
+                logger.warning(
+                    '%i attempts fetching intraday data for %s', context.attempts, symbol
+                )
+            return candles
     logger.error('error fetching intraday data for %s: %s', symbol, str(context.errors[-1]))
     return None
 
-def fetch_daily(
+def request_daily(
     symbol: str,
     /, *,
     start: Optional[Union[str,datetime.date]] = None,
     end: Optional[Union[str, datetime.date]] = None,
     max_attempts: int = constants.TDA_FETCH_RETRY_LIMIT
-) -> Optional[pd.DataFrame]:
-
-    def build_dataframe(rows):
-
-        if len(rows) == 0:
-            return None
-
-        df = pd.DataFrame(rows)
-
-        df = df.astype({
-            'volume': np.float64,
-            'open': np.float64,
-            'close': np.float64,
-            'high': np.float64,
-            'low': np.float64,
-        })
-        df = df[
-            (df['datetime'] >= 0) & \
-            (df['volume'] >= 0) & \
-            (df['open'] > 0) & \
-            (df['close'] > 0) & \
-            (df['high'] > 0) & \
-            (df['low'] > 0)
-        ]
-
-        with pd.option_context('mode.use_inf_as_null', True):
-            df = df.dropna()
-
-        if len(df) == 0:
-            return None
-
-        df['date'] = df['datetime'].apply(
-            lambda x: time.mktime(datetime.datetime.fromtimestamp(x / 1e3).date().timetuple())
-        )
-        df = df.drop('datetime', axis = 1)
-
-        df = twap(df)
-
-        return df.sort_values('date', ascending = True).reset_index(drop = True)
+) -> Optional[List[Dict[str, Any]]]:
 
     start = None if start is None else resolve_date(start)
     end = nth_previous_trading_date(1) if end is None else resolve_date(end)
@@ -229,10 +267,112 @@ def fetch_daily(
                 if start else None,
                 end_datetime = datetime.datetime.combine(end, datetime.time())
             )
+            if result.status_code == 429:
+                raise RateLimitExceeded(
+                    'server response code {0}'.format(result.status_code),
+                    parse_retry_after(result.headers.get('Retry-After'))
+                )
             assert result.status_code == 200, result.raise_for_status()
-            df = build_dataframe(result.json()['candles'])
+            candles = result.json()['candles']
             if context.attempts > 1:
                 logger.warning('%i attempts fetching daily data for %s', context.attempts, symbol)
-            return df
+            return candles
     logger.error('error fetching daily data for %s: %s', symbol, str(context.errors[-1]))
     return None
+
+def fetch_intraday(
+    symbol: str,
+    /, *,
+    period: int = 1,
+    start: Optional[Union[str,datetime.date]] = None,
+    end: Optional[Union[str, datetime.date]] = None,
+    max_attempts: int = constants.TDA_FETCH_RETRY_LIMIT
+) -> Optional[pd.DataFrame]:
+    candles = request_intraday(
+        symbol, period = period, start = start, end = end, max_attempts = max_attempts
+    )
+    return None if candles is None else build_intraday_dataframe(candles, period)
+
+def fetch_daily(
+    symbol: str,
+    /, *,
+    start: Optional[Union[str,datetime.date]] = None,
+    end: Optional[Union[str, datetime.date]] = None,
+    max_attempts: int = constants.TDA_FETCH_RETRY_LIMIT
+) -> Optional[pd.DataFrame]:
+    candles = request_daily(symbol, start = start, end = end, max_attempts = max_attempts)
+    return None if candles is None else build_daily_dataframe(candles)
+
+def _fetch_many(
+    request: Callable[..., Optional[List[Dict[str, Any]]]],
+    build: Callable[..., Optional[pd.DataFrame]],
+    symbols: Union[Iterable[str], Mapping[str, Optional[Union[str, datetime.date]]]],
+    start: Optional[Union[str, datetime.date]],
+    build_args: Tuple[Any, ...],
+    **kwargs
+) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+    starts = symbols if isinstance(symbols, Mapping) else {symbol: start for symbol in symbols}
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers = constants.TDA_FETCH_CONCURRENCY
+    ) as fetch_pool, concurrent.futures.ThreadPoolExecutor(
+        max_workers = constants.TDA_PARSE_CONCURRENCY
+    ) as parse_pool:
+        fetches = {
+            fetch_pool.submit(request, symbol, start = start_, **kwargs): symbol
+            for symbol, start_ in starts.items()
+        }
+        parses: Dict[concurrent.futures.Future, str] = {}
+        pending = set(fetches)
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when = concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future in fetches:
+                    symbol = fetches.pop(future)
+                    try:
+                        candles = future.result()
+                    except Exception as exc:
+                        logger.error('error fetching %s: %s', symbol, str(exc))
+                        candles = None
+                    if candles is None:
+                        yield (symbol, None)
+                    else:
+                        parse = parse_pool.submit(build, candles, *build_args)
+                        parses[parse] = symbol
+                        pending.add(parse)
+                else:
+                    symbol = parses.pop(future)
+                    try:
+                        df = future.result()
+                    except Exception as exc:
+                        logger.error('error parsing %s: %s', symbol, str(exc))
+                        df = None
+                    yield (symbol, df)
+
+def fetch_intraday_many(
+    symbols: Union[Iterable[str], Mapping[str, Optional[Union[str, datetime.date]]]],
+    /, *,
+    period: int = 1,
+    start: Optional[Union[str,datetime.date]] = None,
+    end: Optional[Union[str, datetime.date]] = None,
+    max_attempts: int = constants.TDA_FETCH_RETRY_LIMIT
+) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+    if period not in [1, 5]:
+        raise ValueError()
+    return _fetch_many(
+        request_intraday, build_intraday_dataframe, symbols, start, (period,),
+        period = period, end = end, max_attempts = max_attempts
+    )
+
+def fetch_daily_many(
+    symbols: Union[Iterable[str], Mapping[str, Optional[Union[str, datetime.date]]]],
+    /, *,
+    start: Optional[Union[str,datetime.date]] = None,
+    end: Optional[Union[str, datetime.date]] = None,
+    max_attempts: int = constants.TDA_FETCH_RETRY_LIMIT
+) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+    return _fetch_many(
+        request_daily, build_daily_dataframe, symbols, start, (),
+        end = end, max_attempts = max_attempts
+    )
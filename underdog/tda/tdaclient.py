@@ -2,44 +2,46 @@ import logging
 import threading
 
 from parkit import getenv
-from selenium import webdriver
-from tda import auth
 
 import underdog.constants as constants
 
 logger = logging.getLogger(__name__)
 
-class TDA(threading.local):
+class TDA():
 
     def __init__(self):
-        super().__init__()
         self._client = None
-        self._token_path = getenv(constants.TDA_TOKEN_PATH_ENVNAME)
-        self._api_key = getenv(constants.TDA_API_KEY_ENVNAME)
-        self._redirect_uri = getenv(constants.TDA_REDIRECT_URI_ENVNAME)
+        self._lock = threading.Lock()
 
     @property
     def api_key(self) -> str:
-        return self._api_key
+        return getenv(constants.TDA_API_KEY_ENVNAME)
 
     @property
     def token_path(self) -> str:
-        return self._token_path
+        return getenv(constants.TDA_TOKEN_PATH_ENVNAME)
 
     @property
     def redirect_uri(self) -> str:
-        return self._redirect_uri
+        return getenv(constants.TDA_REDIRECT_URI_ENVNAME)
 
     @property
     def api(self):
         if self._client is None:
-            try:
-                self._client = auth.client_from_token_file(self._token_path, self._api_key)
-            except FileNotFoundError:
-                with webdriver.Chrome() as driver:
-                    self._client = auth.client_from_login_flow(
-                        driver, self._api_key, self._redirect_uri, self._token_path
-                    )
+            with self._lock:
+                if self._client is None:
+                    self._client = self._connect()
         return self._client
 
+    def _connect(self):
+        from tda import auth
+        try:
+            return auth.client_from_token_file(self.token_path, self.api_key)
+        except FileNotFoundError:
+            from selenium import webdriver
+            with webdriver.Chrome() as driver:
+                return auth.client_from_login_flow(
+                    driver, self.api_key, self.redirect_uri, self.token_path
+                )
+
 tda = TDA()
@@ -0,0 +1,147 @@
+import datetime
+import logging
+import time
+import typing
+
+from typing import (
+    Any, Iterable, Tuple
+)
+
+import numba
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def as_datetime64(when: Any) -> np.ndarray:
+    array = np.asarray(when)
+    if array.dtype.kind == 'M':
+        return array.astype('datetime64[D]')
+    if array.dtype.kind == 'O':
+        return np.asarray(
+            [np.datetime64(value, 'D') for value in array.ravel()],
+            dtype = 'datetime64[D]'
+        ).reshape(array.shape)
+    return array.astype('datetime64[D]')
+
+@numba.njit
+def date_index(epochs: np.ndarray, date: float) -> int:
+    index = np.searchsorted(epochs, date)
+    if index < len(epochs) and epochs[index] == date:
+        return index
+    return -1
+
+@numba.njit
+def date_indexes(epochs: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    result = np.empty(len(dates), dtype = np.int64)
+    for i in range(len(dates)):
+        result[i] = date_index(epochs, dates[i])
+    return result
+
+@numba.njit
+def close_timeslot(epochs: np.ndarray, closes: np.ndarray, date: float) -> int:
+    index = date_index(epochs, date)
+    if index < 0:
+        return -1
+    return closes[index]
+
+class TradingCalendar():
+
+    def __init__(
+        self,
+        dates: Iterable[datetime.date],
+        closes: typing.Dict[Tuple[datetime.date, int], int]
+    ):
+        dates = sorted(dates)
+        self._dates = np.asarray(dates, dtype = 'datetime64[D]')
+        self._epochs = self._encode_epochs()
+        self._closes = {
+            period: np.fromiter(
+                (closes.get((date, period), -1) for date in dates),
+                dtype = np.int64, count = len(dates)
+            )
+            for period in sorted({period for _, period in closes})
+        }
+
+    def _encode_epochs(self) -> np.ndarray:
+        return np.fromiter(
+            (time.mktime(date.timetuple()) for date in self._dates.astype(datetime.date)),
+            dtype = np.float64, count = len(self._dates)
+        )
+
+    def __getstate__(self) -> typing.Dict[str, Any]:
+        return dict(dates = self._dates, closes = self._closes)
+
+    def __setstate__(self, state: typing.Dict[str, Any]):
+        self._dates = state['dates']
+        self._closes = state['closes']
+        self._epochs = self._encode_epochs()
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._dates
+
+    @property
+    def epochs(self) -> np.ndarray:
+        return self._epochs
+
+    def closes(self, period: int = 1) -> np.ndarray:
+        return self._closes[period]
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def is_trading_date(self, when: Any) -> np.ndarray:
+        when = as_datetime64(when)
+        index = np.searchsorted(self._dates, when)
+        return (
+            (index < len(self._dates)) & \
+            (self._dates[np.minimum(index, len(self._dates) - 1)] == when)
+        )[()]
+
+    def index(self, when: Any) -> np.ndarray:
+        when = as_datetime64(when)
+        index = np.searchsorted(self._dates, when)
+        found = (index < len(self._dates)) & \
+        (self._dates[np.minimum(index, len(self._dates) - 1)] == when)
+        return np.where(found, index, -1)[()]
+
+    def epoch_index(self, epochs: np.ndarray) -> np.ndarray:
+        return date_indexes(self._epochs, np.asarray(epochs, dtype = np.float64).ravel()) \
+        .reshape(np.shape(epochs))[()]
+
+    def market_close(self, when: Any, period: int = 1) -> np.ndarray:
+        index = self.index(when)
+        return np.where(index >= 0, self._closes[period][index], -1)[()]
+
+    def nth_next(self, n: Any, anchor: Any) -> np.ndarray:
+        n = np.asarray(n, dtype = np.int64)
+        if (n < 0).any():
+            raise ValueError()
+        anchor = as_datetime64(anchor)
+        index = np.searchsorted(self._dates, anchor, side = 'left') + n
+        return np.where(n == 0, anchor, self._dates.take(np.where(n == 0, 0, index)))[()]
+
+    def nth_previous(self, n: Any, anchor: Any) -> np.ndarray:
+        n = np.asarray(n, dtype = np.int64)
+        if (n < 0).any():
+            raise ValueError()
+        anchor = as_datetime64(anchor)
+        index = np.searchsorted(self._dates, anchor, side = 'left') - n
+        return np.where(n == 0, anchor, self._dates.take(np.where(n == 0, 0, index)))[()]
+
+    def _bounds(self, start: Any, end: Any) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = (as_datetime64(start), as_datetime64(end))
+        last = len(self._dates) - 1
+        start_index = np.searchsorted(self._dates, start, side = 'right') - 1
+        end_index = np.searchsorted(self._dates, end, side = 'left')
+        start_index = start_index + (self._dates[start_index] != start)
+        end_index = end_index + (self._dates[np.minimum(end_index, last)] == end)
+        return (start_index, end_index)
+
+    def days_between(self, start: Any, end: Any) -> np.ndarray:
+        start_index, end_index = self._bounds(start, end)
+        return (end_index - start_index - 1)[()]
+
+    def daterange(self, start: Any, end: Any) -> np.ndarray:
+        start_index, end_index = self._bounds(start, end)
+        return self._dates[int(start_index):int(end_index)]
@@ -14,7 +14,6 @@ import bitarray.util
 import numba
 import numpy as np
 import pandas as pd
-import pandas_market_calendars as mcal
 import parkit.constants
 
 from parkit import (
@@ -27,22 +26,28 @@ from parkit import (
 
 import underdog.constants as constants
 
+from underdog.tradingcalendar import TradingCalendar
+
 import_site(
     getenv(parkit.constants.GLOBAL_SITE_STORAGE_PATH_ENVNAME, str),
     create = True
 )
 
-cache = Dict(
-    'memory/underdog/cache',
-    create = True, bind = True,
-    site_uuid = get_site_uuid(
-        getenv(parkit.constants.GLOBAL_SITE_STORAGE_PATH_ENVNAME, str)
+@functools.lru_cache(None)
+def site_cache() -> Dict:
+    return Dict(
+        'memory/underdog/cache',
+        create = True, bind = True,
+        site_uuid = get_site_uuid(
+            getenv(parkit.constants.GLOBAL_SITE_STORAGE_PATH_ENVNAME, str)
+        )
     )
-)
 
 @functools.lru_cache(None)
 def market_dates() -> List[datetime.date]:
+    cache = site_cache()
     if 'market_dates' not in cache:
+        import pandas_market_calendars as mcal
         cache['market_dates'] = [
             date.date()
             for date in mcal.get_calendar('NYSE').valid_days(
@@ -81,7 +86,7 @@ def as_pandas(
             if 'date' in columns:
                 df['date'] = df['date'].apply(datetime.datetime.fromtimestamp)
             if 'symbol' in columns:
-                df['symbol'] = df['symbol'].apply(decode_symbol)
+                df['symbol'] = decode_symbols(df['symbol'].to_numpy())
         return df
     return None
 
@@ -121,35 +126,81 @@ def timeslot_to_timestamp(
     duration = 60 * period if frequency.value == Frequency.MINUTE.value else 3600 * period
     return opents + pd.Timedelta(timeslot * duration, unit = 'seconds')
 
+def _hourly_offsets(
+    seconds: np.ndarray,
+    tz: Optional[str] = None
+) -> np.ndarray:
+    hours, inverse = np.unique(seconds // 3600, return_inverse = True)
+    if tz is None:
+        offsets = np.fromiter(
+            (time.localtime(int(hour) * 3600).tm_gmtoff for hour in hours),
+            dtype = np.int64, count = len(hours)
+        )
+    else:
+        index = pd.to_datetime(hours * 3600, unit = 's', utc = True).tz_convert(tz)
+        offsets = (
+            index.tz_localize(None) - index.tz_convert(None)
+        ).to_numpy().astype('timedelta64[s]').astype(np.int64)
+    return offsets[inverse]
+
+def timestamps_to_timeslots(
+    timestamps: np.ndarray,
+    frequency: Frequency = Frequency.MINUTE,
+    period: int = 1
+) -> np.ndarray:
+    assert frequency in [Frequency.MINUTE, Frequency.HOUR]
+    seconds = np.floor_divide(np.asarray(timestamps, dtype = np.int64), 1000)
+    seconds = seconds + _hourly_offsets(seconds, 'US/Eastern') - 4 * 3600
+    if frequency.value == Frequency.MINUTE.value:
+        seconds_divisor = 60 * period
+    else:
+        seconds_divisor = 3600 * period
+    return np.mod(seconds, 86400) // seconds_divisor
+
+def encode_dates(timestamps: np.ndarray) -> np.ndarray:
+    seconds = np.floor_divide(np.asarray(timestamps, dtype = np.int64), 1000)
+    days, inverse = np.unique(
+        (seconds + _hourly_offsets(seconds)) // 86400,
+        return_inverse = True
+    )
+    epoch = datetime.date(1970, 1, 1).toordinal()
+    dates = np.fromiter(
+        (
+            time.mktime(datetime.date.fromordinal(epoch + int(day)).timetuple())
+            for day in days
+        ),
+        dtype = np.float64, count = len(days)
+    )
+    return dates[inverse]
+
 @functools.lru_cache(None)
 def early_closes() -> typing.Dict[Tuple[datetime.date, int], int]:
+    cache = site_cache()
     if 'early_closes' not in cache:
+        import pandas_market_calendars as mcal
         nyse = mcal.get_calendar('NYSE')
         early_schedule = nyse.schedule(
             start_date = constants.MARKET_CALENDAR_START_DATE,
             end_date = constants.MARKET_CALENDAR_END_DATE
         )
         df = nyse.early_closes(schedule = early_schedule).copy()
-        df['market_close_tzconvert'] = \
-        df['market_close'].apply(lambda x: x.tz_convert(tz = 'US/Eastern'))
         irregular_closes = {}
-        for timestamp in df['market_close_tzconvert'].to_list():
-            date = timestamp.date()
-            irregular_closes[date] = timestamp
+        for timestamp in df['market_close'].to_list():
+            timestamp = timestamp.tz_convert(tz = 'US/Eastern')
+            irregular_closes[timestamp.date()] = timestamp
         result = {}
         for period in [1, 5]:
+            regular_close = timestamp_to_timeslot(
+                pd.Timestamp(
+                    year = 2000, month = 1, day = 3,
+                    hour = 16, minute = 0, second = 0, tz = 'US/Eastern'
+                ),
+                frequency = Frequency.MINUTE,
+                period = period
+            )
             for date in market_dates():
                 if date not in irregular_closes:
-                    result[(date, period)] = timestamp_to_timeslot(
-                        pd.Timestamp(
-                            year = date.year,
-                            month = date.month,
-                            day = date.day,
-                            hour = 16, minute = 0, second = 0, tz = 'US/Eastern'
-                        ),
-                        frequency = Frequency.MINUTE,
-                        period = period
-                    )
+                    result[(date, period)] = regular_close
                 else:
                     result[(date, period)] = timestamp_to_timeslot(
                         irregular_closes[date],
@@ -159,26 +210,49 @@ def early_closes() -> typing.Dict[Tuple[datetime.date, int], int]:
         cache['early_closes'] = result
     return cache['early_closes']
 
-def twap(df: pd.DataFrame) -> pd.DataFrame:
-    oh = np.abs(df['open'] - df['high'])
-    ol = np.abs(df['open'] - df['low'])
-    hl = np.abs(df['high'] - df['low'])
-    lc = np.abs(df['low'] - df['close'])
-    hc = np.abs(df['high'] - df['close'])
+@numba.njit
+def twap_value(o: float, h: float, l: float, c: float) -> float:
+    oh = np.abs(o - h)
+    ol = np.abs(o - l)
+    hl = np.abs(h - l)
+    lc = np.abs(l - c)
+    hc = np.abs(h - c)
     ohlc = oh + hl + lc
     olhc = ol + hl + hc
-    ohmean = (df['open'] + df['high']) / 2
-    olmean = (df['open'] + df['low']) / 2
-    hlmean = (df['high'] + df['low']) / 2
-    lcmean = (df['low'] + df['close']) / 2
-    hcmean = (df['high'] + df['close']) / 2
+    if not ohlc > 0 or not olhc > 0:
+        return c
+    ohmean = (o + h) / 2
+    olmean = (o + l) / 2
+    hlmean = (h + l) / 2
+    lcmean = (l + c) / 2
+    hcmean = (h + c) / 2
     ohlctwap = (oh / ohlc) * ohmean + (hl / ohlc) * hlmean + (lc / ohlc) * lcmean
     olhctwap = (ol / olhc) * olmean + (hl / olhc) * hlmean + (hc / olhc) * hcmean
-    df['twap'] = (ohlctwap + olhctwap) / 2
-    df['twap'] = np.where(
-        df['twap'].isnull(),
-        df['close'], df['twap']
-    )
+    result = (ohlctwap + olhctwap) / 2
+    if np.isnan(result):
+        return c
+    return result
+
+@numba.njit
+def twap_into(
+    o: np.ndarray,
+    h: np.ndarray,
+    l: np.ndarray,
+    c: np.ndarray,
+    out: np.ndarray
+) -> np.ndarray:
+    for i in range(len(out)):
+        out[i] = twap_value(o[i], h[i], l[i], c[i])
+    return out
+
+def twap(
+    df: Union[pd.DataFrame, typing.Dict[str, np.ndarray]]
+) -> Union[pd.DataFrame, typing.Dict[str, np.ndarray]]:
+    columns = [
+        np.asarray(df[name], dtype = np.float64)
+        for name in ['open', 'high', 'low', 'close']
+    ]
+    df['twap'] = twap_into(*columns, np.empty(len(columns[0]), dtype = np.float64))
     return df
 
 def resolve_date(when: Optional[Union[str, datetime.date, np.datetime64]] = None) -> datetime.date:
@@ -190,17 +264,24 @@ def resolve_date(when: Optional[Union[str, datetime.date, np.datetime64]] = None
         return pd.Timestamp(when).date()
     return when
 
+@functools.lru_cache(None)
+def trading_calendar() -> TradingCalendar:
+    cache = site_cache()
+    if 'trading_calendar' not in cache:
+        cache['trading_calendar'] = TradingCalendar(market_dates(), early_closes())
+    return cache['trading_calendar']
+
 @functools.lru_cache(None)
 def market_close_table(
     period: int = 1
 ):
+    calendar = trading_calendar()
     table = numba.typed.Dict.empty(
         key_type = numba.core.types.float64,
         value_type = numba.core.types.int64
     )
-    for (date, period_), timeslot in early_closes().items():
-        if period_ == period:
-            table[np.float64(time.mktime(date.timetuple()))] = timeslot
+    for date, timeslot in zip(calendar.epochs, calendar.closes(period)):
+        table[date] = timeslot
     return table
 
 def market_close(
@@ -215,7 +296,7 @@ def market_close(
         return None
 
 def is_trading_date(when: Optional[Union[str, datetime.date, np.datetime64]] = None) -> bool:
-    return resolve_date(when) in market_dates()
+    return bool(trading_calendar().is_trading_date(resolve_date(when)))
 
 def trading_days_between(
     start: Union[str, datetime.date, np.datetime64],
@@ -294,17 +375,107 @@ def make_encoding():
     return bitarray.util.huffman_code(symbols)
 
 @functools.lru_cache(None)
-def encode_symbol(symbol: str) -> np.float64:
-    if len(symbol) > 10:
+def symbol_tables() -> typing.Dict[str, np.ndarray]:
+    encoding = make_encoding()
+    width = max(len(code) for code in encoding.values())
+    values = np.zeros(256, dtype = np.uint64)
+    lengths = np.zeros(256, dtype = np.uint64)
+    chars = np.zeros(1 << width, dtype = np.uint8)
+    widths = np.zeros(1 << width, dtype = np.uint64)
+    for char, code in encoding.items():
+        value = int(code.to01(), 2)
+        values[ord(char)] = value
+        lengths[ord(char)] = len(code)
+        shift = width - len(code)
+        chars[value << shift:(value + 1) << shift] = ord(char)
+        widths[value << shift:(value + 1) << shift] = len(code)
+    return dict(values = values, lengths = lengths, chars = chars, widths = widths)
+
+@numba.njit
+def _encode_symbols(
+    chars: np.ndarray,
+    values: np.ndarray,
+    lengths: np.ndarray
+) -> Tuple[np.ndarray, int]:
+    result = np.empty(chars.shape[0], dtype = np.uint64)
+    for i in range(chars.shape[0]):
+        bits = np.uint64(1)
+        for j in range(chars.shape[1]):
+            char = chars[i, j]
+            if char == 0:
+                break
+            if lengths[char] == 0:
+                return (result, i)
+            bits = (bits << lengths[char]) | values[char]
+        result[i] = bits
+    return (result, -1)
+
+@numba.njit
+def _decode_symbols(
+    bits: np.ndarray,
+    chars: np.ndarray,
+    widths: np.ndarray,
+    width: int
+) -> np.ndarray:
+    result = np.zeros((len(bits), 10), dtype = np.uint32)
+    mask = np.uint64((1 << width) - 1)
+    for i in range(len(bits)):
+        value = bits[i]
+        if value == 0:
+            continue
+        position = min(63, int(np.log2(np.float64(value))))
+        if value >> np.uint64(position) == 0:
+            position -= 1
+        j = 0
+        while position > 0 and j < 10:
+            if position >= width:
+                index = (value >> np.uint64(position - width)) & mask
+            else:
+                index = (value << np.uint64(width - position)) & mask
+            length = widths[index]
+            if length == 0 or length > position:
+                break
+            result[i, j] = chars[index]
+            position -= length
+            j += 1
+    return result
+
+def encode_symbols(symbols: Union[np.ndarray, List[str]]) -> np.ndarray:
+    symbols = np.asarray(symbols, dtype = str)
+    if symbols.dtype.itemsize > 40 and (np.char.str_len(symbols) > 10).any():
         raise ValueError()
-    a = bitarray.bitarray()
-    a.encode(make_encoding(), symbol)
-    return np.float64(bin_to_float(a.to01()))
+    try:
+        chars = symbols.astype('S10').view(np.uint8).reshape(len(symbols), 10)
+    except UnicodeEncodeError as exc:
+        raise ValueError() from exc
+    tables = symbol_tables()
+    result, invalid = _encode_symbols(chars, tables['values'], tables['lengths'])
+    if invalid >= 0:
+        raise ValueError(symbols[invalid])
+    return result.view(np.float64)
+
+def encodable_symbols(symbols: Union[np.ndarray, List[str]]) -> np.ndarray:
+    symbols = np.asarray(symbols, dtype = str)
+    codes = symbols.view(np.uint32).reshape(len(symbols), symbols.dtype.itemsize // 4)
+    lengths = symbol_tables()['lengths']
+    known = (codes < len(lengths)) & (lengths[np.minimum(codes, len(lengths) - 1)] > 0)
+    return ((codes == 0) | known).all(axis = 1) & ((codes != 0).sum(axis = 1) <= 10)
+
+def decode_symbols(array: np.ndarray) -> np.ndarray:
+    tables = symbol_tables()
+    chars = _decode_symbols(
+        np.ascontiguousarray(array, dtype = np.float64).view(np.uint64),
+        tables['chars'],
+        tables['widths'],
+        int(np.log2(len(tables['chars'])))
+    )
+    return chars.view('<U10').reshape(len(chars))
+
+def encode_symbol(symbol: str) -> np.float64:
+    return encode_symbols([symbol])[0]
 
-@functools.lru_cache(None)
 def decode_symbol(n: np.float64) -> str:
-    a = bitarray.bitarray(float_to_bin(n))
-    return ''.join(a.decode(make_encoding()))
+    return str(decode_symbols(np.array([n]))[0])
 
 def encode_date(date):
     return time.mktime(
@@ -314,43 +485,71 @@ def encode_date(date):
 def decode_date(timestamp):
     return datetime.datetime.fromtimestamp(timestamp)
 
-# def twap_(o, h, l, c):
-#     oh = np.abs(o - h)
-#     ol = np.abs(o - l)
-#     hl = np.abs(h - l)
-#     lc = np.abs(l - c)
-#     hc = np.abs(h - c)
-#     ohlc = oh + hl + lc
-#     olhc = ol + hl + hc
-#     ohmean = (o + h) / 2
-#     olmean = (o + l) / 2
-#     hlmean = (h + l) / 2
-#     lcmean = (l + c) / 2
-#     hcmean = (h + c) / 2
-#     ohlctwap = (oh / ohlc) * ohmean + (hl / ohlc) * hlmean + (lc / ohlc) * lcmean
-#     olhctwap = (ol / olhc) * olmean + (hl / olhc) * hlmean + (hc / olhc) * hcmean
-#     return (ohlctwap + olhctwap) / 2
-
-# def resample(
-#     df: pd.DataFrame,
-#     period: int
-# ) -> pd.DataFrame:
-#     return df
-#     if period not in [1, 5, 30]:
-#         df = df.set_index('timestamp')
-#         rule = '{0}T'.format(period)
-#         df = df.resample(rule).aggregate(dict(
-#             open = 'first',
-#             close = 'last',
-#             low = 'min',
-#             high = 'max',
-#             volume = 'sum',
-#             date = 'first',
-#             symbol = 'first'
-#         )).dropna().reset_index(drop = False)
-#         df = twap(df)
-#         df['trading_segment'] = df['timestamp'] \
-#         .apply(get_trading_segment)
-#         df['timeslot'] = df['timestamp'] \
-#         .apply(lambda x: timestamp_to_timeslot(x, period = period))
-#     return df
+@numba.njit
+def _resample_intraday(
+    array: np.ndarray,
+    factor: int,
+    n_slots: int
+) -> np.ndarray:
+    n_days = 0
+    for i in range(len(array)):
+        if i == 0 or array[i, 7] != array[i - 1, 7]:
+            n_days += 1
+    result = np.full((n_days * n_slots, 8), np.nan)
+    day = -1
+    for i in range(len(array)):
+        if i == 0 or array[i, 7] != array[i - 1, 7]:
+            day += 1
+            for slot in range(n_slots):
+                row = day * n_slots + slot
+                result[row, 0] = slot
+                result[row, 5] = 0.
+                result[row, 7] = array[i, 7]
+        slot = int(array[i, 0]) // factor
+        if slot < 0 or slot >= n_slots:
+            continue
+        row = day * n_slots + slot
+        result[row, 5] += array[i, 5]
+        if np.isnan(array[i, 1]):
+            continue
+        if np.isnan(result[row, 1]):
+            result[row, 1] = array[i, 1]
+            result[row, 2] = array[i, 2]
+            result[row, 3] = array[i, 3]
+        else:
+            result[row, 2] = max(result[row, 2], array[i, 2])
+            result[row, 3] = min(result[row, 3], array[i, 3])
+        result[row, 4] = array[i, 4]
+    for day in range(n_days):
+        first = -1
+        last = np.nan
+        for slot in range(n_slots):
+            row = day * n_slots + slot
+            if not np.isnan(result[row, 1]):
+                result[row, 6] = twap_value(
+                    result[row, 1], result[row, 2], result[row, 3], result[row, 4]
+                )
+                if first < 0:
+                    first = slot
+                last = result[row, 6]
+            else:
+                result[row, 6] = last
+        if first > 0:
+            result[day * n_slots:day * n_slots + first, 6] = result[day * n_slots + first, 6]
+    return result
+
+def resample_intraday(
+    array: np.ndarray,
+    period: int,
+    source_period: int = 1
+) -> np.ndarray:
+    assert array.dtype == np.float64 and array.shape[1] == 8
+    if period % source_period != 0 or 960 % period != 0:
+        raise ValueError()
+    if period == source_period:
+        return array
+    return _resample_intraday(
+        np.ascontiguousarray(array),
+        period // source_period,
+        960 // period
+    )